@@ -1,7 +1,12 @@
 from src.config import debug
 from src.db.Entities import Role
 from src.db.Management import Manager
-from src.db.Services import DeviceService, UserService
+from src.db.Services import DeviceService, UserService, RollupService
+from src.db.Ingest import IngestQueue
+from src.analysis.pipeline import ImagePipeline
+from src.monitor import ResourceSampler
+from src.db.Maintenance import PartitionMaintenance
+from src.analysis.cloudbase import LCLBackfill
 from src import create_app
 # from werkzeug.security import generate_password_hash
 from src.config import *
@@ -18,9 +23,17 @@ if __name__ == "__main__":
         if not DeviceService.exists("34:85:18:41:EB:78"): DeviceService.add("34:85:18:41:EB:78", "Work-ESP", "ESP32S3", "OV5640", 173.00, 56.853470, 14.824620)
         if not DeviceService.exists("34:85:18:41:59:14"): DeviceService.add("34:85:18:41:59:14", "ESP001", "ESP32S3", "OV5640", 173.00, 56.853470, 14.824620)
         if not DeviceService.exists("34:85:18:42:6D:94"): DeviceService.add("34:85:18:42:6D:94", "ESP002", "ESP32S3", "OV5640", 173.00, 56.853470, 14.824620)
+        DeviceService.refresh()
+        RollupService.catch_up()
+        if WRITE_BEHIND: IngestQueue.start()
+        if IMAGE_PIPELINE: ImagePipeline.start()
+        if LCL_BACKFILL: LCLBackfill.start()
+        PartitionMaintenance.start()
+        Manager.release()
     except Exception as e:
         debug(e)
-        
+
+    ResourceSampler.start()
     
     app.config['SECRET_KEY'] = 'AMOGUSdugamladufria'
     app.run(host="0.0.0.0", port = 8080)
\ No newline at end of file
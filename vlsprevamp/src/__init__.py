@@ -1,6 +1,8 @@
 from flask import Flask
 from flask_login import LoginManager
 from src.db.Services import UserService, UserEntity
+from src.db.Management import Manager
+from src import metrics
 
 def create_app():
     app = Flask(__name__)
@@ -13,6 +15,13 @@ def create_app():
     def load_user(ID: str) -> UserEntity:
         return UserService.get_user(userID = ID)
 
+    # Per-route request counts and latencies for /metrics.
+    app.before_request(metrics.before_request)
+    app.after_request(metrics.after_request)
+
+    # Return each request's database connection to the pool.
+    app.teardown_appcontext(Manager.release)
+
     from src.views import views
     from src.auth import auth
     from src.api import api
@@ -16,10 +16,12 @@ Code from: https://romps.berkeley.edu/papers/pubs-2016-lcl.html
 }
 """
 
-from math import exp
+from math import exp, log
 from scipy.special import lambertw
-from src.config import debug, dispatch
+from src.config import debug, dispatch, Tuple
 from src.db.Entities import ReadingEntity
+from src.db.Frame import ReadingFrame
+import numpy as np
 
 class Measurement:
     """
@@ -146,8 +148,8 @@ class Measurement:
         bS = -(self.E0v + self.E0s - (self.cvv - self.cvs) * self.Ttrip) / (self.rgasv * T)
         cS = pv / self.__pvstars(T) * exp(-(self.E0v + self.E0s - (self.cvv - self.cvs) * self.Ttrip) / (self.rgasv * T))
         
-        lcl = cpm * T / self.ggr * (1 - bL / (aL * lambertw(bL / aL * cL ** (1 / aL), -1).real))
-        ldl = cpm * T / self.ggr * (1 - bS / (aS * lambertw(bS / aS * cS ** (1 / aS), -1).real))
+        lcl = cpm * T / self.ggr * (1 - bL / (aL * lambertw_m1_scalar(bL / aL * cL ** (1 / aL))))
+        ldl = cpm * T / self.ggr * (1 - bS / (aS * lambertw_m1_scalar(bS / aS * cS ** (1 / aS))))
 
         if return_ldl:
             return ldl
@@ -161,39 +163,148 @@ class Measurement:
         return self.__lcl(self.PRESSURE, temp, self.HUMIDITY) * 3.28084
 
 
+    # The Romps reference checks are run by src/analysis/lcl_bench.py.
+
+
+# Vectorized path. Same formulas and constants as Measurement, evaluated over whole arrays.
+M = Measurement
+
+def __pvstarl_array(T:np.ndarray) -> np.ndarray:
+    return M.ptrip * (T/M.Ttrip)**((M.cpv-M.cvl)/M.rgasv) * \
+        np.exp( (M.E0v - (M.cvv-M.cvl)*M.Ttrip) / M.rgasv * (1/M.Ttrip - 1/T) )
+
+def __pvstars_array(T:np.ndarray) -> np.ndarray:
+    return M.ptrip * (T/M.Ttrip)**((M.cpv-M.cvs)/M.rgasv) * \
+        np.exp( (M.E0v + M.E0s - (M.cvv-M.cvs)*M.Ttrip) / M.rgasv * (1/M.Ttrip - 1/T) )
+
+
+# Real lower branch of the Lambert W function, W(-1), which both levels of the LCL are expressed in.
+# scipy's lambertw is a general complex routine. On the real branch, w*exp(w) = z is solved as
+# w + log(-w) = log(-z) with two Halley steps from the approximation of Barry et al. (2000),
+# which is within 3e-4 relatively everywhere. Over the arguments the atmosphere produces
+# (about -0.21 to -1e-6) the result agrees with scipy to 2 ulp, see src/analysis/lcl_bench.py.
+# Within about 1e-4 of -1/e it is the more accurate of the two, as the residual w*exp(w) - z shows.
+# Arguments off the real branch, outside (-1/e, 0), are still handed to scipy.
+WM1_BRANCH:float = -exp(-1)
+WM1_ITERATIONS:int = 2
+WM1_M1:float = 0.3361
+WM1_M2:float = -0.0042
+WM1_M3:float = -0.0201
+
+def lambertw_m1(z:np.ndarray) -> np.ndarray:
     """
-    def __within_bound() -> bool:
-        
-        Test that the results of calulations are within expected range for known readings.
-        
-        out = abs(lcl(1e5,300,rhl=.5,return_ldl=False)/( 1433.844139279)-1) < 1e-10 and \
-        abs(lcl(1e5,300,rhs=.5,return_ldl=False)/( 923.2222457185)-1) < 1e-10 and \
-        abs(lcl(1e5,200,rhl=.5,return_ldl=False)/( 542.8017712435)-1) < 1e-10 and \
-        abs(lcl(1e5,200,rhs=.5,return_ldl=False)/( 1061.585301941)-1) < 1e-10 and \
-        abs(lcl(1e5,300,rhl=.5,return_ldl=True )/( 1639.249726127)-1) < 1e-10 and \
-        abs(lcl(1e5,300,rhs=.5,return_ldl=True )/( 1217.336637217)-1) < 1e-10 and \
-        abs(lcl(1e5,200,rhl=.5,return_ldl=True )/(-8.609834216556)-1) < 1e-10 and \
-        abs(lcl(1e5,200,rhs=.5,return_ldl=True )/( 508.6366558898)-1) < 1e-10
-            
-        if out: debug('Success') 
-        else: debug("Failure")
-        return out
-
-
-    def __error_ranges() -> None:
-        
-        Test the error ranges for known measurements.
-        
-        debug("Error range differences: ")
-        debug(f"{abs(lcl(1e5,300,rhl=.5,return_ldl=False) - 1433.844139279):0,.13f}")
-        debug(f"{abs(lcl(1e5,300,rhs=.5,return_ldl=False) - 923.2222457185):0,.13f}")
-        debug(f"{abs(lcl(1e5,200,rhl=.5,return_ldl=False) - 542.8017712435):0,.13f}")
-        debug(f"{abs(lcl(1e5,200,rhs=.5,return_ldl=False) - 1061.585301941):0,.13f}")
-        debug(f"{abs(lcl(1e5,300,rhl=.5,return_ldl=True ) - 1639.249726127):0,.13f}")
-        debug(f"{abs(lcl(1e5,300,rhs=.5,return_ldl=True ) - 1217.336637217):0,.13f}")
-        debug(f"{abs(lcl(1e5,200,rhl=.5,return_ldl=True ) - -8.609834216556):0,.13f}")
-        debug(f"{abs(lcl(1e5,200,rhs=.5,return_ldl=True ) - 508.6366558898):0,.13f}")
+    Real W(-1) of every element of z, as lambertw(z, -1).real, in the shape of z.
+    """
+    z = np.asarray(z, dtype = np.float64)
+    shape = z.shape
+    z = np.atleast_1d(z)
+    special = (z <= WM1_BRANCH) | (z >= 0)
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        target = np.log(-np.where(special, -0.1, z))
+        s = -1 - target
+        root = np.sqrt(s)
+        w = -1 - s - 2/WM1_M1 * (1 - 1/(1 + WM1_M1 * np.sqrt(s/2) / (1 + WM1_M2 * s * np.exp(WM1_M3 * root))))
+        for _ in range(WM1_ITERATIONS):
+            g = w + np.log(-w) - target
+            step = g * w / (w + 1)
+            step /= 1 + g / (2 * (w + 1)**2)
+            w -= step
+
+    if special.any():
+        zs = z[special]
+        w[special] = np.where(zs == WM1_BRANCH, -1.0, lambertw(zs, -1).real)
+    return w.reshape(shape)
+
+def lambertw_m1_scalar(z:float) -> float:
+    """
+    Real W(-1) of one float, for the scalar lcl of Measurement.
+    """
+    if z == WM1_BRANCH: return -1.0
+    if not WM1_BRANCH < z < 0: return lambertw(z, -1).real
+    target = log(-z)
+    s = -1 - target
+    w = -1 - s - 2/WM1_M1 * (1 - 1/(1 + WM1_M1 * (s/2)**.5 / (1 + WM1_M2 * s * exp(WM1_M3 * s**.5))))
+    for _ in range(WM1_ITERATIONS):
+        g = w + log(-w) - target
+        w -= g * w / (w + 1) / (1 + g / (2 * (w + 1)**2))
+    return w
+
+def lcl_array(p:np.ndarray, T:np.ndarray, rh:np.ndarray = None, rhl:np.ndarray = None, rhs:np.ndarray = None,
+              return_ldl:bool = False, return_min_lcl_ldl:bool = False) -> np.ndarray:
+    """
+    Vectorized lcl. Takes the same inputs as the scalar lcl of Measurement, as arrays
+    broadcast against each other, and returns the LCL (or LDL, or their minimum) in meters
+    with one lambertw_m1 call per level over the whole array.
+    Where the scalar path reports pv greater than p, the result is NaN, as it is for NaN inputs.
+    """
+    if return_ldl and return_min_lcl_ldl:
+        raise ValueError("return_ldl and return_min_lcl_ldl cannot both be true")
+    if sum(value is not None for value in (rh, rhl, rhs)) != 1:
+        raise ValueError("Exactly one of rh, rhl, and rhs must be specified")
+
+    p = np.asarray(p, dtype = np.float64)
+    T = np.asarray(T, dtype = np.float64)
+    pvl = __pvstarl_array(T)
+    pvs = __pvstars_array(T)
+    liquid = T > M.Ttrip
+
+    if rh is not None:
+        rh = np.asarray(rh, dtype = np.float64)
+        pv = rh * np.where(liquid, pvl, pvs)
+    elif rhl is not None:
+        pv = np.asarray(rhl, dtype = np.float64) * pvl
+        rh = np.where(liquid, pv / pvl, pv / pvs)
+    else:
+        pv = np.asarray(rhs, dtype = np.float64) * pvs
+        rh = np.where(liquid, pv / pvl, pv / pvs)
+
+    qv = M.rgasa * pv / (M.rgasv * p + (M.rgasa - M.rgasv) * pv)
+    rgasm = (1 - qv) * M.rgasa + qv * M.rgasv
+    cpm = (1 - qv) * M.cpa + qv * M.cpv
+    dry = cpm * T / M.ggr
+
+    with np.errstate(divide = "ignore", invalid = "ignore", over = "ignore"):
+        if not return_ldl:
+            aL = -(M.cpv - M.cvl) / M.rgasv + cpm / rgasm
+            bL = -(M.E0v - (M.cvv - M.cvl) * M.Ttrip) / (M.rgasv * T)
+            cL = pv / pvl * np.exp(-(M.E0v - (M.cvv - M.cvl) * M.Ttrip) / (M.rgasv * T))
+            lcl = dry * (1 - bL / (aL * lambertw_m1(bL / aL * cL ** (1 / aL))))
+
+        if return_ldl or return_min_lcl_ldl:
+            aS = -(M.cpv - M.cvs) / M.rgasv + cpm / rgasm
+            bS = -(M.E0v + M.E0s - (M.cvv - M.cvs) * M.Ttrip) / (M.rgasv * T)
+            cS = pv / pvs * np.exp(-(M.E0v + M.E0s - (M.cvv - M.cvs) * M.Ttrip) / (M.rgasv * T))
+            ldl = dry * (1 - bS / (aS * lambertw_m1(bS / aS * cS ** (1 / aS))))
+
+    if return_ldl: out = ldl
+    elif return_min_lcl_ldl: out = np.minimum(lcl, ldl)
+    else: out = lcl
+
+    out = np.where(rh == 0, dry, out)
+    return np.where(pv > p, np.nan, out)
+
+
+def normalise(pressure:np.ndarray, humidity:np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Bring stored readings to the units lcl expects, pressure in Pa and humidity as a fraction.
+    The units devices report in aren't recorded, so values are judged by magnitude:
+    pressure below 2000 is taken as hPa and humidity above 1 as a percentage.
+    """
+    pressure = np.asarray(pressure, dtype = np.float64)
+    humidity = np.asarray(humidity, dtype = np.float64)
+    pressure = np.where(pressure < 2000, pressure * 100, pressure)
+    humidity = np.where(humidity > 1, humidity / 100, humidity)
+    return pressure, humidity
+
+
+def lcl_readings(frame:ReadingFrame, feet:bool = False) -> np.ndarray:
+    """
+    LCL in meters, or in feet like Measurement.lcl_feet, of every reading in a frame.
+    Readings with a missing measurement give NaN.
     """
+    pressure, humidity = normalise(frame.pressure, frame.humidity)
+    lcl = lcl_array(pressure, np.asarray(frame.temperature, dtype = np.float64) + 273.15, humidity)
+    return lcl * 3.28084 if feet else lcl
 
 
 if __name__ == "__main__":
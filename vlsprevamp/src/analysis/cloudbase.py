@@ -0,0 +1,143 @@
+from src.config import *
+from src.db.Management import Manager
+from src.db.Services import DeviceService, ReadingService
+from src.db.Entities import ReadingEntity
+from src.db.Frame import ReadingFrame
+from src.analysis.LCL import lcl_array, normalise
+from threading import Thread, Event, Lock
+from math import isnan
+
+
+def cloud_base(altitude:np.ndarray | float, temperature:np.ndarray, humidity:np.ndarray, pressure:np.ndarray) -> np.ndarray:
+    """
+    Lifting condensation level in metres above sea level, from station altitude and the stored
+    temperature (Celsius), humidity and pressure. Readings with a missing measurement (-999 or NaN),
+    an unknown altitude or values lcl can't solve for give NaN.
+    """
+    temperature = np.asarray(temperature, dtype = np.float64)
+    humidity = np.asarray(humidity, dtype = np.float64)
+    pressure = np.asarray(pressure, dtype = np.float64)
+    missing = (temperature == -999) | (humidity == -999) | (pressure == -999) | (humidity < 0)
+
+    pressure, humidity = normalise(pressure, humidity)
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        lcl = np.asarray(altitude, dtype = np.float64) + lcl_array(pressure, temperature + 273.15, humidity)
+    return np.where(missing, np.nan, lcl)
+
+
+def altitude(MAC:str) -> float:
+    """
+    Altitude of a device from the registry, NaN if the device is unknown.
+    """
+    device = DeviceService.get(MAC)
+    if device is None or device.get_altitude() is None: return np.nan
+    return float(device.get_altitude())
+
+
+def stored_lcl(altitudes:np.ndarray, lcl:np.ndarray) -> List[float | None]:
+    """
+    The lcl_m values to store for computed LCLs. Readings of an unknown device get None, to be
+    backfilled once it is registered. Any other reading the LCL can't be computed for never will be,
+    so it gets -999 like an unreadable measurement.
+    """
+    return [None if isnan(height) else -999 if isnan(value) else value
+            for height, value in zip(np.asarray(altitudes, dtype = np.float64).tolist(), lcl.tolist())]
+
+
+def attach_lcl(readings:List[ReadingEntity]) -> None:
+    """
+    Compute and set the LCL of each reading in one vectorized pass, as stored_lcl gives it.
+    """
+    if not readings: return
+    altitudes = {mac: altitude(mac) for mac in {reading.get_mac() for reading in readings}}
+    heights = [altitudes[reading.get_mac()] for reading in readings]
+    lcl = cloud_base(heights,
+                     [reading.get_temperature() for reading in readings],
+                     [reading.get_humidity() for reading in readings],
+                     [reading.get_pressure() for reading in readings])
+    for reading, value in zip(readings, stored_lcl(heights, lcl)):
+        reading.set_lcl(value)
+
+
+class LCLBackfill:
+    """
+    Static background job filling in lcl_m for readings stored without one.
+    Readings are walked in primary key order LCL_BACKFILL_ROWS at a time, resuming each chunk
+    from the last key seen, so every chunk is an index range scan and the job can commit between chunks.
+    Each chunk is computed as one array and written back with a single UPDATE joined against its values.
+    Readings the LCL can't be computed for are marked -999 so later runs skip them, except those
+    of unknown devices, which stay NULL until the device is registered.
+    """
+    __stop:Event = Event()
+    __thread:Thread | None = None
+    __lock:Lock = Lock()
+    __filled:int = 0
+
+    @staticmethod
+    def start() -> None:
+        """
+        Start a backfill run in the background if one is not already running.
+        """
+        with LCLBackfill.__lock:
+            if LCLBackfill.running(): return
+            LCLBackfill.__stop.clear()
+            LCLBackfill.__thread = Thread(target = LCLBackfill.__run, name = "lcl-backfill", daemon = True)
+            LCLBackfill.__thread.start()
+
+    @staticmethod
+    def stop() -> None:
+        with LCLBackfill.__lock:
+            thread = LCLBackfill.__thread
+            if thread is None: return
+            LCLBackfill.__stop.set()
+            thread.join()
+            LCLBackfill.__thread = None
+
+    @staticmethod
+    def running() -> bool:
+        thread = LCLBackfill.__thread
+        return thread is not None and thread.is_alive()
+
+    @staticmethod
+    def filled() -> int:
+        """
+        Readings given an LCL by the backfill since startup.
+        """
+        return LCLBackfill.__filled
+
+    @staticmethod
+    def run(chunk_size:int = LCL_BACKFILL_ROWS) -> int:
+        """
+        Fill in every missing LCL in the calling thread. Return the number of readings updated.
+        """
+        filled = 0
+        after = None
+        while not LCLBackfill.__stop.is_set():
+            rows = ReadingService.missing_lcl(after, chunk_size)
+            if not rows: break
+            after = (rows[-1][1], rows[-1][0])
+
+            frame = ReadingFrame.from_rows(rows)
+            altitudes = np.array([altitude(mac) for mac in frame.categories.tolist()], dtype = np.float64)
+            heights = altitudes[frame.codes]
+            lcl = cloud_base(heights, frame.temperature, frame.humidity, frame.pressure)
+
+            values = [(value, row[0], row[1]) for row, value in zip(rows, stored_lcl(heights, lcl)) if value is not None]
+            updated = ReadingService.update_lcl_many(values)
+            if updated is None: break
+            filled += updated
+            LCLBackfill.__filled += updated
+
+            if len(rows) < chunk_size: break
+
+        return filled
+
+    @staticmethod
+    def __run() -> None:
+        try:
+            filled = LCLBackfill.run()
+            debug(f"LCL backfill stored {filled} readings.")
+        except Exception as e:
+            debug(f"Couldn't backfill reading LCL -> {e}")
+        finally:
+            Manager.release()
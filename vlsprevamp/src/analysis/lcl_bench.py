@@ -0,0 +1,223 @@
+"""
+Regression checks and throughput benchmark of the LCL calculation.
+
+    python -m src.analysis.lcl_bench                 # checks, then 1k, 100k and 10M readings
+    python -m src.analysis.lcl_bench 1000 100000     # checks, then the given sizes
+
+Exits non-zero if any check fails, so it can gate a change to LCL.py.
+"""
+
+from src.analysis.LCL import Measurement, lcl_array, lambertw_m1, lambertw_m1_scalar, WM1_BRANCH
+from scipy.special import lambertw
+from src.config import Dict, List, Tuple
+from typing import Callable
+from time import perf_counter
+import numpy as np
+import sys
+
+# Published values from Romps (2017), as (p, T, keyword arguments of lcl, value in metres).
+REFERENCES:Tuple[Tuple[float, float, Dict[str, float | bool], float], ...] = (
+    (1e5, 300, {"rhl": .5},                       1433.844139279),
+    (1e5, 300, {"rhs": .5},                       923.2222457185),
+    (1e5, 200, {"rhl": .5},                       542.8017712435),
+    (1e5, 200, {"rhs": .5},                       1061.585301941),
+    (1e5, 300, {"rhl": .5, "return_ldl": True},   1639.249726127),
+    (1e5, 300, {"rhs": .5, "return_ldl": True},   1217.336637217),
+    (1e5, 200, {"rhl": .5, "return_ldl": True},   -8.609834216556),
+    (1e5, 200, {"rhs": .5, "return_ldl": True},   508.6366558898),
+)
+
+# The references were computed with g = 9.81 m/s^2 and Measurement uses standard gravity.
+# The LCL is inversely proportional to g, so the references are rescaled rather than loosened.
+REFERENCE_GGR:float = 9.81
+
+# Relative tolerance of the reference checks, as in Romps' own test, and of the batch paths against the scalar one.
+# Readings near saturation, whose LCL or LDL is within SATURATION_LEVEL metres of zero, are held to
+# SATURATION_ABSOLUTE metres instead, since there any rounding is a large relative error.
+# Measured: 6e-12 relative elsewhere and 2e-11 m near saturation.
+REFERENCE_TOLERANCE:float = 1e-10
+BATCH_TOLERANCE:float = 1e-10
+SATURATION_LEVEL:float = 1.0
+SATURATION_ABSOLUTE:float = 1e-10
+
+# Relative tolerance of lambertw_m1 against scipy, and how close to the branch point -1/e it is held
+# to it. Nearer than that the problem is too ill-conditioned for either to be a reference for the other.
+LAMBERTW_TOLERANCE:float = 1e-14
+LAMBERTW_NEAREST:float = 1e-4
+
+# Benchmark sizes, the most readings timed through the scalar path (larger sizes are extrapolated
+# from its rate), and the chunk the batch path is fed in, as the backfill would.
+BENCH_SIZES:Tuple[int, ...] = (1_000, 100_000, 10_000_000)
+SCALAR_CAP:int = 100_000
+BATCH_CHUNK:int = 1_000_000
+
+# The scalar lcl of Measurement. It only uses the class constants, so any instance will do.
+scalar_lcl:Callable[..., float] = Measurement(0.0, 0.0, 0.0)._Measurement__lcl
+
+# Batch implementations benchmarked against the scalar path, by name. Each takes p, T and rh arrays.
+BATCH_PATHS:Dict[str, Callable[[np.ndarray, np.ndarray, np.ndarray], np.ndarray]] = {
+    "batch": lambda p, T, rh: lcl_array(p, T, rh),
+}
+
+
+def check_references(tolerance:float = REFERENCE_TOLERANCE) -> List[str]:
+    """
+    Compare the scalar and batch paths to the published LCL and LDL values.
+    Return a description of every mismatch, empty if all pass.
+    """
+    failures = []
+    scale = REFERENCE_GGR / Measurement.ggr
+    for p, T, kwargs, expected in REFERENCES:
+        expected *= scale
+        for path, value in (("scalar", scalar_lcl(p, T, **kwargs)), ("batch", float(lcl_array(p, T, **kwargs)))):
+            if not abs(value / expected - 1) < tolerance:
+                failures.append(f"{path} lcl({p:g}, {T:g}, {kwargs}) = {value!r}, expected {expected!r}")
+    return failures
+
+
+def sample(n:int, seed:int = 0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    n random readings spanning what the stations report: 500 to 1050 hPa, -40 to 50 °C
+    and 1 to 100 % humidity, as p in Pa, T in K and rh as a fraction.
+    """
+    rng = np.random.default_rng(seed)
+    return rng.uniform(5e4, 1.05e5, n), rng.uniform(233.15, 323.15, n), rng.uniform(.01, 1, n)
+
+
+def mismatched(value:np.ndarray, expected:np.ndarray, tolerance:float = BATCH_TOLERANCE) -> np.ndarray:
+    """
+    Where value is off expected by more than tolerance relatively, or by more than
+    SATURATION_ABSOLUTE metres where expected is within SATURATION_LEVEL metres of zero.
+    """
+    near = np.abs(expected) < SATURATION_LEVEL
+    close = np.where(near, np.isclose(value, expected, rtol = 0, atol = SATURATION_ABSOLUTE, equal_nan = True),
+                     np.isclose(value, expected, rtol = tolerance, atol = 0, equal_nan = True))
+    return ~close
+
+
+def check_batch(n:int = 20_000, tolerance:float = BATCH_TOLERANCE) -> List[str]:
+    """
+    Compare every batch path to the scalar path over n random readings and n more within 1e-3 of
+    saturation, for all three humidity definitions and all three return modes.
+    Return a description of every mismatch.
+    """
+    p, T, rh = sample(n, seed = 1)
+    saturated = sample(n, seed = 2)
+    p, T = np.concatenate((p, saturated[0])), np.concatenate((T, saturated[1]))
+    rh = np.concatenate((rh, 1 - np.logspace(-16, -3, n)))
+    n = len(p)
+    failures = []
+    for mode in ({}, {"return_ldl": True}, {"return_min_lcl_ldl": True}):
+        for key in ("rh", "rhl", "rhs"):
+            expected = np.array([scalar_lcl(p[i], T[i], **{key: rh[i]}, **mode) for i in range(n)])
+            expected[expected == -2] = np.nan
+            value = lcl_array(p, T, **{key: rh}, **mode)
+            wrong = mismatched(value, expected, tolerance)
+            if wrong.any():
+                worst = np.max(np.abs(value[wrong] - expected[wrong]))
+                failures.append(f"batch {key} {mode}: {np.count_nonzero(wrong)} of {n} differ, worst by {worst:.3g} m")
+
+    expected = np.array([scalar_lcl(p[i], T[i], rh[i]) for i in range(n)])
+    expected[expected == -2] = np.nan
+    for name, path in BATCH_PATHS.items():
+        value = path(p, T, rh)
+        wrong = mismatched(value, expected, tolerance)
+        if wrong.any():
+            worst = np.max(np.abs(value[wrong] - expected[wrong]))
+            failures.append(f"{name}: {np.count_nonzero(wrong)} of {n} differ, worst by {worst:.3g} m")
+    return failures
+
+
+def check_lambertw(n:int = 2_000_000, tolerance:float = LAMBERTW_TOLERANCE) -> List[str]:
+    """
+    Compare lambertw_m1 and lambertw_m1_scalar to scipy's lambertw(z, -1).real, from -1e-300 up to
+    LAMBERTW_NEAREST of the branch point, and at the special arguments handed to scipy.
+    Return a description of every mismatch.
+    """
+    failures = []
+    z = -np.logspace(-300, np.log10(-WM1_BRANCH - LAMBERTW_NEAREST), n)
+    expected = lambertw(z, -1).real
+    worst = float(np.max(np.abs(lambertw_m1(z) / expected - 1)))
+    if not worst <= tolerance:
+        failures.append(f"lambertw_m1: worst relative error {worst:.3g} above {tolerance:.3g}")
+
+    worst = max(abs(lambertw_m1_scalar(x) / lambertw(x, -1).real - 1) for x in z[::n // 10_000].tolist())
+    if not worst <= tolerance:
+        failures.append(f"lambertw_m1_scalar: worst relative error {worst:.3g} above {tolerance:.3g}")
+
+    special = np.array([0.0, -0.5, 0.1, np.nan])
+    if not np.array_equal(lambertw_m1(special), lambertw(special, -1).real, equal_nan = True):
+        failures.append("lambertw_m1: arguments off the real branch differ from scipy")
+    for x in [*special.tolist(), WM1_BRANCH, -0.1]:
+        try:
+            value = lambertw_m1(np.float64(x))
+            if value.shape != () or not np.array_equal(value, lambertw_m1(np.array([x]))[0], equal_nan = True):
+                failures.append(f"lambertw_m1: 0-d argument {x} differs from the array result")
+        except Exception as e:
+            failures.append(f"lambertw_m1: 0-d argument {x} raised {e!r}")
+    if lambertw_m1_scalar(WM1_BRANCH) != -1 or lambertw_m1(np.array([WM1_BRANCH]))[0] != -1:
+        failures.append("lambertw_m1: W(-1/e) is not -1")
+    return failures
+
+
+def time_scalar(n:int, cap:int = SCALAR_CAP) -> Tuple[float, bool]:
+    """
+    Seconds for the scalar path to compute n LCLs, and whether the time was extrapolated
+    from the first cap readings.
+    """
+    timed = min(n, cap)
+    p, T, rh = (column.tolist() for column in sample(timed))
+    start = perf_counter()
+    for i in range(timed):
+        scalar_lcl(p[i], T[i], rh[i])
+    seconds = perf_counter() - start
+    return seconds * n / timed, timed < n
+
+
+def time_batch(path:Callable[[np.ndarray, np.ndarray, np.ndarray], np.ndarray], n:int, chunk:int = BATCH_CHUNK) -> float:
+    """
+    Seconds for a batch path to compute n LCLs, chunk readings per call.
+    Inputs are generated outside the timed region.
+    """
+    seconds = 0.0
+    for offset in range(0, n, chunk):
+        p, T, rh = sample(min(chunk, n - offset), seed = offset)
+        start = perf_counter()
+        path(p, T, rh)
+        seconds += perf_counter() - start
+    return seconds
+
+
+def benchmark(sizes:Tuple[int, ...] = BENCH_SIZES, cap:int = SCALAR_CAP) -> List[Dict[str, float | int | str | bool]]:
+    """
+    Readings per second of the scalar path and of every batch path at each size.
+    """
+    results = []
+    for n in sizes:
+        seconds, extrapolated = time_scalar(n, cap)
+        results.append({"path": "scalar", "n": n, "seconds": seconds, "per_second": n / seconds, "extrapolated": extrapolated})
+        for name, path in BATCH_PATHS.items():
+            seconds = time_batch(path, n)
+            results.append({"path": name, "n": n, "seconds": seconds, "per_second": n / seconds, "extrapolated": False})
+    return results
+
+
+def main(argv:List[str]) -> int:
+    sizes = tuple(int(arg) for arg in argv) or BENCH_SIZES
+
+    failures = check_references() + check_lambertw() + check_batch()
+    for failure in failures:
+        print(f"FAIL {failure}")
+    print(f"{len(REFERENCES)} reference values, lambertw_m1, {len(BATCH_PATHS)} batch paths checked: "
+          f"{'FAILED' if failures else 'ok'}")
+
+    print(f"{'path':<16}{'readings':>12}{'seconds':>12}{'readings/s':>16}")
+    for result in benchmark(sizes):
+        note = "  (extrapolated)" if result["extrapolated"] else ""
+        print(f"{result['path']:<16}{result['n']:>12,}{result['seconds']:>12.3f}{result['per_second']:>16,.0f}{note}")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,212 @@
+from concurrent.futures import ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from threading import Lock, Thread
+from queue import Queue
+from src.db.Management import Manager
+from src.analysis.calibrate import undistort
+from src.db.Services import DeviceService, ArtifactService
+from src.config import *
+import glob
+
+"""
+Background processing of uploaded sky images.
+Each image is undistorted with the latest calibration of its camera model and split into
+a cloud image and a sky image. The work runs on a process pool so it scales with cores and
+never touches the request thread. The resulting paths are recorded against the reading.
+"""
+
+# HSV bounds for cloud pixels: low saturation and reasonably bright, i.e. white through grey.
+CLOUD_LOWER_HSV = np.array([0, 0, 90])
+CLOUD_UPPER_HSV = np.array([180, 60, 255])
+
+# Anything darker than this is neither sky nor cloud, e.g. the vignette left by undistortion.
+DARK_UPPER_HSV = np.array([180, 255, 30])
+
+# Camera calibrations, found from this module rather than the working directory.
+CALIBRATION_ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "calibration"))
+
+
+@functools.lru_cache(maxsize=None)
+def __load_calibration(model:str) -> Tuple[NDArray, NDArray] | None:
+    """
+    Load the most recent camera matrix and distortion coefficients for a camera model.
+    Cached per worker process.
+    """
+    matrices = sorted(glob.glob(os.path.join(CALIBRATION_ROOT, model, "matrices", "*.toml")))
+    if not matrices: return None
+    matrix = load_toml(matrices[-1])
+    if not matrix: return None
+    return np.asarray(matrix['matrix']), np.asarray(matrix['distCoeff'])
+
+
+def segment(img:Matlike) -> Tuple[Matlike, Matlike, float]:
+    """
+    Split a sky image into an image of the clouds and an image of the clear sky.
+    Also return the fraction of non-dark pixels that are cloud.
+    """
+    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+    cloud_mask = cv2.inRange(hsv, CLOUD_LOWER_HSV, CLOUD_UPPER_HSV)
+    dark_mask = cv2.inRange(hsv, np.array([0, 0, 0]), DARK_UPPER_HSV)
+    sky_mask = cv2.bitwise_not(cv2.bitwise_or(cloud_mask, dark_mask))
+
+    cloud_img = cv2.bitwise_and(img, img, mask = cloud_mask)
+    sky_img = cv2.bitwise_and(img, img, mask = sky_mask)
+
+    cloud = cv2.countNonZero(cloud_mask)
+    sky = cv2.countNonZero(sky_mask)
+    fraction = cloud / (cloud + sky) if (cloud + sky) else 0.0
+    return cloud_img, sky_img, fraction
+
+
+def process_image(image_path:str, model:str, output_folder:str = IMAGE_ARTIFACTS) -> Dict[str, str | float] | None:
+    """
+    Undistort and segment a single uploaded image, writing the results to the output folder.
+    Runs inside a worker process.
+    """
+    img = cv2.imread(image_path)
+    if img is None:
+        debug(f"Couldn't read image for processing: {image_path}")
+        return None
+
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    undistorted_path = None
+    calibration = __load_calibration(model)
+    if calibration is not None:
+        cameraMatrix, dist = calibration
+        img = undistort(img, cameraMatrix, dist, remapping = True, cropping = True)
+        undistorted_path = os.path.join(output_folder, f"{stem}__undistorted.jpg")
+        cv2.imwrite(undistorted_path, img)
+
+    cloud_img, sky_img, fraction = segment(img)
+    cloud_path = os.path.join(output_folder, f"{stem}__cloud.jpg")
+    sky_path = os.path.join(output_folder, f"{stem}__sky.jpg")
+    cv2.imwrite(cloud_path, cloud_img)
+    cv2.imwrite(sky_path, sky_img)
+
+    return {"undistorted_path": undistorted_path,
+            "cloud_path": cloud_path,
+            "sky_path": sky_path,
+            "cloud_fraction": fraction}
+
+
+class ImagePipeline:
+    """
+    Static process pool for post-upload image processing.
+    Workers are spawned rather than forked, since the pool grows from request threads of a
+    multithreaded server. If a worker dies the pool is replaced, and the images it had queued are
+    counted as failed; uploads themselves never fail because of the pipeline.
+    Finished images are handed to a recorder thread owned by the pipeline, which writes their
+    artifacts to the database, so no database work runs on the executor's callback thread.
+    """
+    __pool:ProcessPoolExecutor | None = None
+    __results:Queue = Queue()
+    __recorder:Thread | None = None
+    __lock:Lock = Lock()
+    __workers:int | None = PIPELINE_WORKERS
+    __pending:int = 0
+    __processed:int = 0
+    __failed:int = 0
+
+    @staticmethod
+    def start(workers:int | None = PIPELINE_WORKERS) -> None:
+        """
+        Start the worker pool if it is not already running.
+        """
+        with ImagePipeline.__lock:
+            if ImagePipeline.__pool is not None: return
+            ImagePipeline.__workers = workers
+            ImagePipeline.__pool = ImagePipeline.__create_pool()
+            ImagePipeline.__recorder = Thread(target = ImagePipeline.__run, name = "image-recorder", daemon = True)
+            ImagePipeline.__recorder.start()
+        debug("Image processing pipeline started.")
+
+    @staticmethod
+    def stop(wait:bool = True) -> None:
+        """
+        Shut the worker pool down, by default after finishing queued images.
+        """
+        with ImagePipeline.__lock:
+            pool = ImagePipeline.__pool
+            recorder = ImagePipeline.__recorder
+            ImagePipeline.__pool = None
+            ImagePipeline.__recorder = None
+        if pool is not None: pool.shutdown(wait = wait)
+        if recorder is not None:
+            ImagePipeline.__results.put(None)
+            if wait: recorder.join()
+
+    @staticmethod
+    def running() -> bool:
+        return ImagePipeline.__pool is not None
+
+    @staticmethod
+    def submit(MAC:str, timestamp:str, image_path:str) -> bool:
+        """
+        Queue an uploaded image for processing. Return False if the pipeline is not running
+        or couldn't take the image.
+        """
+        pool = ImagePipeline.__pool
+        if pool is None: return False
+
+        device = DeviceService.get(MAC)
+        model = camera_model.match(device.get_cam_model()) if device else camera_model.UNKNOWN
+
+        with ImagePipeline.__lock:
+            ImagePipeline.__pending += 1
+        try:
+            future = pool.submit(process_image, image_path, model.value)
+        except (BrokenProcessPool, RuntimeError) as e:
+            debug(f"Couldn't queue image for {MAC} at {timestamp} -> {e}")
+            with ImagePipeline.__lock:
+                ImagePipeline.__pending -= 1
+                ImagePipeline.__failed += 1
+                # Replace a broken pool, unless stop() or another request already did.
+                if isinstance(e, BrokenProcessPool) and ImagePipeline.__pool is pool:
+                    ImagePipeline.__pool = ImagePipeline.__create_pool()
+            pool.shutdown(wait = False)
+            return False
+
+        future.add_done_callback(lambda done: ImagePipeline.__results.put((MAC, timestamp, done)))
+        return True
+
+    @staticmethod
+    def stats() -> Dict[str, int | bool]:
+        return {"running": ImagePipeline.running(),
+                "pending": ImagePipeline.__pending,
+                "processed": ImagePipeline.__processed,
+                "failed": ImagePipeline.__failed}
+
+    @staticmethod
+    def __create_pool() -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers = ImagePipeline.__workers, mp_context = get_context("spawn"))
+
+    @staticmethod
+    def __run() -> None:
+        """
+        Recorder loop. Exits at the None queued by stop, after everything before it.
+        """
+        while True:
+            item = ImagePipeline.__results.get()
+            if item is None: break
+            ImagePipeline.__record(*item)
+        Manager.release()
+
+    @staticmethod
+    def __record(MAC:str, timestamp:str, future:Future) -> None:
+        """
+        Store the artifacts of a finished image against its reading.
+        """
+        stored = False
+        try:
+            result = future.result()
+            if result is not None:
+                stored = ArtifactService.upsert(MAC, timestamp, result["undistorted_path"], result["cloud_path"],
+                                                result["sky_path"], result["cloud_fraction"])
+        except Exception as e:
+            debug(f"Couldn't process image for {MAC} at {timestamp} -> {e}")
+
+        with ImagePipeline.__lock:
+            ImagePipeline.__pending -= 1
+            if stored: ImagePipeline.__processed += 1
+            else: ImagePipeline.__failed += 1
@@ -1,6 +1,8 @@
 from src.handlers import *
 from flask import url_for, redirect
-from flask_login import current_user
+from flask_login import current_user, login_required
+from src.export import ReadingExport
+import tempfile
 
 api = Blueprint("api", __name__) 
 
@@ -22,25 +24,37 @@ def update() -> Response:
     ESPSHA = HEADERS.ESP_SHA256.value
 
     try:
-        err = header_check(request, ('X-esp32-sta-mac', 'X-esp32-version', 'X-esp32-sketch-sha256'))
-        if not err: return err
-
-        # mac = request.headers.get('X-esp32-sta-mac')
-        # board_sha256 = request.headers.get("X-esp32-sketch-sha256")
-        board_ver = request.headers.get('X-esp32-version')
-        
-        conf_dict = load_config()
-        if conf_dict is None: return jsonify({"message": "No Current updates"}), 304
-        FIRMWARE_FILE = conf_dict['path']
-        
-        if FIRMWARE_FILE is None: return jsonify({"message": "No Current updates"}), 304
-        if not need_update(board_ver): jsonify({"message": "No Current updates"}), 304
-        if not os.path.exists(f"{ROOT}/{FIRMWARE_FILE}"): return jsonify({"message":"File Not Found"}), 404
-        
-        response = make_response(send_file(f"{ROOT}/{FIRMWARE_FILE}", mimetype="application/octet-stream"), 200)
+        err = header_check(request.headers, (ESPMAC, ESPVER, ESPSHA))
+        if err is not None: return err
+
+        board_ver = request.headers.get(ESPVER)
+        board_sha256 = request.headers.get(ESPSHA)
+
+        release = Firmware.current()
+        if release is None: return jsonify({"message": "No Current updates"}), 304
+
+        # Devices already running this exact build are answered from the cached metadata.
+        if board_sha256.lower() == release.sha256: return jsonify({"message": "No Current updates"}), 304
+        if not need_update(board_ver): return jsonify({"message": "No Current updates"}), 304
+
+        # Serve a precompressed variant when the device can inflate one.
+        encoding = choose_encoding(release, request.headers.get(HEADERS.ESP_ENCODING.value),
+                                   request.headers.get('Accept-Encoding'))
+        path = release.variants[encoding] if encoding else release.path
+        etag = f"{release.sha256}-{encoding}" if encoding else release.sha256
+
+        # ETag and Range support let interrupted OTA transfers resume instead of restarting.
+        response = send_file(path, mimetype="application/octet-stream", conditional=True,
+                             etag=etag, last_modified=release.mtime, max_age=0)
+        if encoding: response.headers["Content-Encoding"] = encoding
+        response.headers["Vary"] = f"Accept-Encoding, {HEADERS.ESP_ENCODING.value}"
+        response.headers["X-Firmware-Version"] = release.version
+        response.headers["X-Firmware-Sha256"] = release.sha256
+        response.headers["X-Firmware-Size"] = str(release.size)
         return response
-    
+
     except Exception as e:
+        debug(e)
         return jsonify({"message": "No Current updates"}), 304
 
 
@@ -59,6 +73,9 @@ def reading() -> Response:
         timestamp = request.headers.get(TSH)
         mac = request.headers.get(MAH)
 
+        if not valid_timestamp(timestamp):
+            return jsonify({"error": "Malformed timestamp"}), 400
+
         readings = [request.args.get("temperature"),
                     request.args.get("humidity"),
                     request.args.get("pressure"),
@@ -74,16 +91,14 @@ def reading() -> Response:
         else:
             out = {"message": "Thanks for the readings!"}
 
-        for index, reading in enumerate(readings):
-            try:
-                readings[index] = float(reading)
-            except Exception:
-                readings[index] = -999.00
-
-        
-        t, h, p, d = readings
-        if not ReadingService.exists(mac, timestamp): ReadingService.add(mac, t, h, p, d, timestamp)
-        else: ReadingService.update_readings(mac, t, h, p, d, timestamp)
+        t, h, p, d = parse_readings(readings)
+        entity = ReadingEntity(mac, t, h, p, d, timestamp)
+        attach_lcl([entity])
+        if IngestQueue.running():
+            if not IngestQueue.put(entity):
+                return jsonify({"error": "Ingest queue full"}), 503, {"Retry-After": "5"}
+        elif not ReadingService.upsert(mac, timestamp, t, h, p, d, lcl = entity.get_lcl()):
+            return jsonify({"error": "Couldn't store reading"}), 500
 
         return jsonify(out), 200
         
@@ -92,6 +107,202 @@ def reading() -> Response:
         debug(e)
         return jsonify({"error": str(e)}), 500
 
+@api.route("/readings/batch", methods=['POST'])
+def readings_batch() -> Response:
+    """
+    Handler for the /readings/batch route on the server.
+    Accepts a JSON array of buffered readings for one device and stores them BATCH_WRITE_ROWS per transaction.
+    Each record is either [timestamp, temperature, humidity, pressure, dewpoint]
+    or an object with those keys. Records with a value missing are rejected, as /reading does,
+    rather than overwriting stored measurements with -999.
+    """
+    MAH = HEADERS.MACADDRESS.value
+    KEYS = ("timestamp", "temperature", "humidity", "pressure", "dewpoint")
+    try:
+
+        err = header_check(request.headers, (MAH,))
+        if err is not None:return err
+
+        mac = request.headers.get(MAH)
+        records = request.get_json(silent=True)
+        if isinstance(records, dict): records = records.get("readings")
+
+        if not isinstance(records, list):
+            return jsonify({"error": "Expected a JSON array of readings"}), 400
+        if len(records) > MAX_BATCH_READINGS:
+            return jsonify({"error": f"Batch larger than {MAX_BATCH_READINGS} readings"}), 413
+
+        results = []
+        entities = []
+        for index, record in enumerate(records):
+            if isinstance(record, dict): record = [record.get(key) for key in KEYS]
+
+            if not isinstance(record, list) or len(record) != len(KEYS) or not valid_timestamp(str(record[0])):
+                results.append({"index": index, "status": "rejected", "error": "Malformed reading"})
+                continue
+            if None in record:
+                results.append({"index": index, "status": "rejected", "error": "Missing values in reading"})
+                continue
+
+            timestamp = str(record[0])
+            t, h, p, d = parse_readings(record[1:])
+            entities.append(ReadingEntity(mac, t, h, p, d, timestamp))
+            results.append({"index": index, "timestamp": timestamp, "status": "stored"})
+
+        attach_lcl(entities)
+        written = [result for result in results if result["status"] == "stored"]
+        stored = 0
+        for offset in range(0, len(entities), BATCH_WRITE_ROWS):
+            chunk = entities[offset:offset + BATCH_WRITE_ROWS]
+            if ReadingService.upsert_many(chunk):
+                stored += len(chunk)
+                continue
+            for result in written[offset:offset + BATCH_WRITE_ROWS]: result["status"] = "failed"
+
+        if stored < len(entities):
+            return jsonify({"error": "Couldn't store readings", "stored": stored, "results": results}), 500
+
+        return jsonify({"message": "Thanks for the readings!", "stored": stored, "results": results}), 200
+
+    except Exception as e:
+        debug(e)
+        return jsonify({"error": str(e)}), 500
+
+@api.route("/readings", methods=['GET'])
+@login_required
+def readings() -> Response:
+    """
+    Handler for the /readings route on the server.
+    Readings of one device in [from, to), oldest first, at most limit per page.
+    Pass the returned next timestamp as after to fetch the following page.
+    The body is streamed as it is read from the database, as one JSON object
+    or, with format=ndjson, one reading per line.
+    """
+    try:
+        mac = request.args.get("mac")
+        if not mac: return jsonify({"error": "Missing mac parameter"}), 400
+
+        try:
+            start = parse_timestamp(request.args.get("from"))
+            end = parse_timestamp(request.args.get("to"))
+            after = parse_timestamp(request.args.get("after"))
+        except ValueError:
+            return jsonify({"error": "Timestamps must be ISO 8601"}), 400
+
+        try:
+            limit = int(request.args.get("limit", READINGS_PAGE_LIMIT))
+        except ValueError:
+            return jsonify({"error": "limit must be an integer"}), 400
+        if not 0 < limit <= READINGS_MAX_LIMIT:
+            return jsonify({"error": f"limit must be between 1 and {READINGS_MAX_LIMIT}"}), 400
+
+        if not DeviceService.exists(mac): return jsonify({"error": "Unknown device"}), 404
+
+        rows = ReadingService.iter_range(mac, start, end, after, limit)
+
+        if request.args.get("format") == "ndjson":
+            # A full page means there may be more: the last line's timestamp is the next cursor.
+            def generate_ndjson():
+                for reading in rows:
+                    yield json.dumps(reading_to_dict(reading)) + "\n"
+            return Response(stream_with_context(generate_ndjson()), mimetype="application/x-ndjson")
+
+        def generate_json():
+            yield f'{{"mac": {json.dumps(mac)}, "readings": ['
+            count, last = 0, None
+            for reading in rows:
+                record = reading_to_dict(reading)
+                yield ("," if count else "") + json.dumps(record)
+                count, last = count + 1, record["timestamp"]
+            following = last if count == limit else None
+            yield f'], "count": {count}, "next": {json.dumps(following)}}}'
+
+        return Response(stream_with_context(generate_json()), mimetype="application/json")
+
+    except Exception as e:
+        debug(e)
+        return jsonify({"error": str(e)}), 500
+
+@api.route("/readings/export", methods=['GET'])
+@login_required
+def readings_export() -> Response:
+    """
+    Handler for the /readings/export route on the server.
+    Bulk export of the readings in [from, to), of one device or all of them without mac,
+    as streamed CSV or as a .npz or Parquet file for loading straight into NumPy.
+    """
+    try:
+        mac = request.args.get("mac") or None
+        kind = request.args.get("format", "csv")
+        if kind not in ("csv", "npz", "parquet"):
+            return jsonify({"error": "format must be csv, npz or parquet"}), 400
+
+        try:
+            start = parse_timestamp(request.args.get("from"))
+            end = parse_timestamp(request.args.get("to"))
+        except ValueError:
+            return jsonify({"error": "Timestamps must be ISO 8601"}), 400
+
+        if mac and not DeviceService.exists(mac): return jsonify({"error": "Unknown device"}), 404
+
+        name = f"readings-{(mac or 'all').replace(':', '-')}.{kind}"
+        if kind == "csv":
+            return Response(stream_with_context(ReadingExport.csv(mac, start, end)), mimetype="text/csv",
+                            headers={"Content-Disposition": f"attachment; filename={name}"})
+
+        if kind == "parquet" and not ReadingExport.parquet_available():
+            return jsonify({"error": "Parquet export is not available on this server"}), 501
+
+        handle, path = tempfile.mkstemp(suffix=f".{kind}")
+        os.close(handle)
+        try:
+            if kind == "npz": ReadingExport.npz(path, mac, start, end)
+            else: ReadingExport.parquet(path, mac, start, end)
+            response = send_file(path, mimetype="application/octet-stream", as_attachment=True, download_name=name)
+        except Exception:
+            os.remove(path)
+            raise
+
+        # Close hooks only run for responses the server iterates, not for passed-through files.
+        response.direct_passthrough = False
+        response.call_on_close(lambda: os.remove(path))
+        return response
+
+    except Exception as e:
+        debug(e)
+        return jsonify({"error": str(e)}), 500
+
+@api.route("/readings/rollup", methods=['GET'])
+@login_required
+def readings_rollup() -> Response:
+    """
+    Handler for the /readings/rollup route on the server.
+    Count, min, max and mean of each measurement per hour or day for one device in [from, to),
+    served from the rollup tables so the cost follows the number of buckets, not of readings.
+    """
+    try:
+        mac = request.args.get("mac")
+        if not mac: return jsonify({"error": "Missing mac parameter"}), 400
+
+        resolution = request.args.get("resolution", "hour")
+        if resolution not in ("hour", "day"):
+            return jsonify({"error": "resolution must be hour or day"}), 400
+
+        try:
+            start = parse_timestamp(request.args.get("from"))
+            end = parse_timestamp(request.args.get("to"))
+        except ValueError:
+            return jsonify({"error": "Timestamps must be ISO 8601"}), 400
+
+        if not DeviceService.exists(mac): return jsonify({"error": "Unknown device"}), 404
+
+        rollups = RollupService.get(mac, start, end, resolution)
+        return jsonify({"mac": mac, "resolution": resolution, "buckets": [rollup_to_dict(rollup) for rollup in rollups]}), 200
+
+    except Exception as e:
+        debug(e)
+        return jsonify({"error": str(e)}), 500
+
 @api.route("/status", methods = ['GET'])
 def status() -> Response:
     """
@@ -112,11 +323,17 @@ def status() -> Response:
         bmp = request.args.get('bmp')
         cam = request.args.get('cam')
 
+        if not valid_timestamp(timestamp):
+            return jsonify({"error": "Malformed timestamp"}), 400
+
         if sht not in valid or bmp not in valid or cam not in valid:
             return jsonify({"error": "Invalid status type received"}), 400
         
-        if not StatusService.exists(mac): StatusService.add(mac, timestamp, sht, bmp, cam)
-        else: StatusService.update(mac, timestamp, sht, bmp, cam)
+        if IngestQueue.running():
+            if not IngestQueue.put(SensorEntity(mac, timestamp, sht, bmp, cam, True)):
+                return jsonify({"error": "Ingest queue full"}), 503, {"Retry-After": "5"}
+        elif not StatusService.upsert(mac, timestamp, sht, bmp, cam):
+            return jsonify({"error": "Couldn't store status"}), 500
         
         return jsonify({"message": "Thanks for the stats"}), 200
 
@@ -136,21 +353,24 @@ def images() -> Response:
         err = header_check(request.headers, (MAH, TSH))
         if err is not None:return err
 
+        if request.content_length is not None and request.content_length > MAX_IMAGE_BYTES:
+            return jsonify({"error": f"Image larger than {MAX_IMAGE_BYTES} bytes"}), 413
+
         timestamp = request.headers.get(TSH)
         mac = request.headers.get(MAH)
-        image_raw_bytes = request.get_data()  #get the whole body
-        # Assume the timestamp is already formattedon board.
-        # Create a filename based on the timestamp
-        filename = f"{timestamp_to_path(timestamp)}.jpg"
 
-        # Save the image to the specified directory
-        image_path = os.path.join(IMAGE_UPLOADS, filename)
-        with open(image_path, 'wb') as f:
-            f.write(image_raw_bytes)
+        # Stream the body into the image store without holding it in memory.
+        image_path, written = ImageStore.put(request.stream, mac, timestamp)
+        if written > MAX_IMAGE_BYTES:
+            return jsonify({"error": f"Image larger than {MAX_IMAGE_BYTES} bytes"}), 413
+        if image_path is None:
+            return jsonify({"error": "Empty image body"}), 400
 
-        if not ReadingService.exists(mac, timestamp): ReadingService.add(mac, None, None, None, None, timestamp, image_path)
-        else: ReadingService.update_path(mac, timestamp, image_path)
+        if not ReadingService.upsert(mac, timestamp, filepath=image_path):
+            return jsonify({"error": "Couldn't store image reading"}), 500
+        ImagePipeline.submit(mac, timestamp, image_path)
 
+        filename = os.path.relpath(image_path, IMAGE_UPLOADS)
         return jsonify({"message": "Image saved successfully", "filename": filename}), 200
 
     except Exception as e:
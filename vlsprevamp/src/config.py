@@ -6,7 +6,7 @@ from gc import collect
 import functools
 from datetime import datetime
 from enum import Enum
-from typing import List, Sequence, Tuple, Dict, NamedTuple, Any
+from typing import List, Sequence, Tuple, Dict, NamedTuple, Any, Generator
 import toml
 from multipledispatch import dispatch 
 
@@ -105,14 +105,97 @@ def mkdir(folder:str) -> str:
 
 ROOT = f"{os.getcwd()}/src"
 IMAGE_UPLOADS = mkdir(f"{ROOT}/uploads")
+IMAGE_ARTIFACTS = mkdir(f"{ROOT}/artifacts")
 
 # Various config files
 root_config_folder = mkdir(f'{ROOT}/configs')
+FIRMWARE_CACHE = mkdir(f"{ROOT}/firmware_cache")
 FIRMWARE_CONF:str = f"{root_config_folder}/firmware_cfg.toml"
 DB_CONFIG:str = f"{root_config_folder}/db_cfg.toml"
 
 IMAGE_TYPES = ("jpg","png","jpeg","bmp","svg")
 
+# Largest number of buffered readings a device may replay in one batch request,
+# written BATCH_WRITE_ROWS at a time so a failed write only fails the records in it.
+MAX_BATCH_READINGS:int = 500
+BATCH_WRITE_ROWS:int = 100
+
+# Seconds before the in-process device registry is reloaded from the database.
+DEVICE_CACHE_TTL:float = 300.0
+
+# Write-behind ingestion. When enabled, readings and status heartbeats are queued
+# and written to the database in batches by a background thread.
+WRITE_BEHIND:bool = False
+INGEST_QUEUE_SIZE:int = 10_000
+INGEST_BATCH_SIZE:int = 200
+INGEST_FLUSH_MS:int = 500
+
+# Image uploads are streamed to disk in chunks and rejected above this size.
+MAX_IMAGE_BYTES:int = 8 * 1024 * 1024
+UPLOAD_CHUNK_BYTES:int = 64 * 1024
+
+# Re-apply the schema to an existing database on startup. Off by default; run
+# python -m src.db.migrate once after upgrading instead.
+MIGRATE_SCHEMA:bool = False
+
+# Post-upload image processing. Uploaded images are undistorted and split into cloud
+# and sky on a process pool. A worker count of None uses every core.
+IMAGE_PIPELINE:bool = False
+PIPELINE_WORKERS:int | None = None
+
+# Seconds between checks of the firmware manifest and binary for changes.
+FIRMWARE_CHECK_SECONDS:float = 5.0
+
+# Per-device rate limits for the device API, as (tokens per second, burst size) per route.
+# Routes not listed are not limited. At most RATE_LIMIT_MAX_KEYS buckets are kept.
+RATE_LIMITS:Dict[str, Tuple[float, int]] = {
+    "api.reading": (1.0, 30),
+    "api.readings_batch": (0.2, 5),
+    "api.status": (0.5, 10),
+    "api.images": (0.2, 5),
+    "api.update": (0.1, 5)
+}
+RATE_LIMIT_MAX_KEYS:int = 10_000
+
+# Database statement timing. Statements slower than SLOW_QUERY_MS are logged with their
+# SQL text and parameters, each truncated to SLOW_QUERY_LOG_CHARS.
+QUERY_TIMING:bool = True
+SLOW_QUERY_MS:float = 200.0
+SLOW_QUERY_LOG_CHARS:int = 500
+
+# Background resource sampling. One sample every SAMPLE_INTERVAL seconds,
+# the last SAMPLE_HISTORY kept (an hour by default).
+SAMPLE_INTERVAL:float = 10.0
+SAMPLE_HISTORY:int = 360
+
+# Time-range reading queries. Pages default to READINGS_PAGE_LIMIT rows, at most READINGS_MAX_LIMIT,
+# read from the database FETCH_CHUNK_ROWS rows at a time.
+READINGS_PAGE_LIMIT:int = 1000
+READINGS_MAX_LIMIT:int = 50_000
+FETCH_CHUNK_ROWS:int = 500
+
+# Hourly and daily reading rollups. If ROLLUPS_ON_WRITE is False they are only
+# brought up to date by the catch-up job, ROLLUP_REBUILD_DAYS days per transaction.
+ROLLUPS_ON_WRITE:bool = True
+ROLLUP_REBUILD_DAYS:int = 7
+
+# Rows read and converted per chunk by the bulk reading export.
+EXPORT_CHUNK_ROWS:int = 50_000
+
+# Monthly RANGE partitioning of Readings. If PARTITION_READINGS is True a new database creates it partitioned;
+# an existing table is only converted by python -m src.db.migrate --partition-readings, since that rewrites
+# it and drops its foreign key. Every PARTITION_INTERVAL seconds partitions are created PARTITION_MONTHS_AHEAD
+# months in advance, and with a retention period, months older than READINGS_RETENTION_MONTHS are dropped whole.
+PARTITION_READINGS:bool = False
+PARTITION_INTERVAL:float = 6 * 60 * 60
+PARTITION_MONTHS_AHEAD:int = 3
+READINGS_RETENTION_MONTHS:int | None = None
+
+# Background fill of Readings.lcl_m for rows stored before it existed, or while the device was unknown.
+# LCL_BACKFILL_ROWS rows are read, computed and written back per transaction.
+LCL_BACKFILL:bool = False
+LCL_BACKFILL_ROWS:int = 5_000
+
 # If debug is True, print. Otherwise, do nothing.
 DEBUG:bool = True
 def out01(x:str) -> None:
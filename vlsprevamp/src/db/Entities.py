@@ -29,7 +29,9 @@ class Role(Enum):
 class Entity(ABC):
     """
     Abstract Parent class representing a given row in a db table, either devices, sensors or readings. 
+    Entities declare __slots__ so instances carry no per-object __dict__.
     """
+    __slots__ = ("__MAC", "__timestamp")
     __MAC:str
     __timestamp:str
 
@@ -50,6 +52,7 @@ class DeviceEntity(Entity):
     """
     Row of data in the Devices table.
     """
+    __slots__ = ("__name", "__dev_model", "__cam_model", "__altitude", "__latitude", "__longitude")
     __name:str
     __dev_model:str
     __cam_model:str
@@ -92,20 +95,23 @@ class ReadingEntity(Entity):
     """
     Row of data in the Reading table.
     """
+    __slots__ = ("__temperature", "__humidity", "__pressure", "__dewpoint", "__image_path", "__lcl")
     __temperature:float
     __humidity:float
     __pressure:float
     __dewpoint:float
     __image_path:str
+    __lcl:float
 
     def __init__(self, mac:str, temp:float, humidity:float, pressure:float,
-                dewpoint:float, timestamp:str, path:str = None):
+                dewpoint:float, timestamp:str, path:str = None, lcl:float = None):
         Entity.__init__(self, mac, timestamp)
         self.__dewpoint = dewpoint
         self.__humidity = humidity
         self.__image_path = path
         self.__pressure = pressure
         self.__temperature = temp
+        self.__lcl = lcl
     
     def get_dewpoint(self) -> float:
         return self.__dewpoint
@@ -125,10 +131,94 @@ class ReadingEntity(Entity):
     def set_image_path(self, path:str) -> None:
         self.__image_path = path
 
+    def get_lcl(self) -> float:
+        """
+        Lifting condensation level in metres above sea level, None if not computed.
+        """
+        return self.__lcl
+
+    def set_lcl(self, lcl:float) -> None:
+        self.__lcl = lcl
+
+class ArtifactEntity(Entity):
+    """
+    Row of data in the ImageArtifacts table.
+    """
+    __slots__ = ("__undistorted_path", "__cloud_path", "__sky_path", "__cloud_fraction")
+    __undistorted_path:str
+    __cloud_path:str
+    __sky_path:str
+    __cloud_fraction:float
+
+    def __init__(self, mac:str, timestamp:str, undistorted_path:str, cloud_path:str,
+                 sky_path:str, cloud_fraction:float):
+        Entity.__init__(self, mac, timestamp)
+        self.__undistorted_path = undistorted_path
+        self.__cloud_path = cloud_path
+        self.__sky_path = sky_path
+        self.__cloud_fraction = cloud_fraction
+
+    def get_undistorted_path(self) -> str:
+        return self.__undistorted_path
+
+    def get_cloud_path(self) -> str:
+        return self.__cloud_path
+
+    def get_sky_path(self) -> str:
+        return self.__sky_path
+
+    def get_cloud_fraction(self) -> float:
+        return self.__cloud_fraction
+
+class Aggregate(NamedTuple):
+    """
+    Summary of one measurement over a rollup bucket. min, max and mean are None without valid samples.
+    """
+    count:int
+    min:float | None
+    max:float | None
+    mean:float | None
+
+class RollupEntity(Entity):
+    """
+    Row of data in the ReadingsHourly or ReadingsDaily tables. The timestamp is the start of the bucket.
+    """
+    __slots__ = ("__samples", "__temperature", "__humidity", "__pressure", "__dewpoint")
+    __samples:int
+    __temperature:Aggregate
+    __humidity:Aggregate
+    __pressure:Aggregate
+    __dewpoint:Aggregate
+
+    def __init__(self, mac:str, bucket:str, samples:int, temperature:Aggregate,
+                 humidity:Aggregate, pressure:Aggregate, dewpoint:Aggregate):
+        Entity.__init__(self, mac, bucket)
+        self.__samples = samples
+        self.__temperature = temperature
+        self.__humidity = humidity
+        self.__pressure = pressure
+        self.__dewpoint = dewpoint
+
+    def get_samples(self) -> int:
+        return self.__samples
+
+    def get_temperature(self) -> Aggregate:
+        return self.__temperature
+
+    def get_humidity(self) -> Aggregate:
+        return self.__humidity
+
+    def get_pressure(self) -> Aggregate:
+        return self.__pressure
+
+    def get_dewpoint(self) -> Aggregate:
+        return self.__dewpoint
+
 class SensorEntity(Entity):
     """
     Row of data in the senors table.
     """
+    __slots__ = ("__sht", "__bmp", "__cam", "__wifi")
     __sht:bool
     __bmp:bool
     __cam:bool
@@ -172,6 +262,7 @@ class LocationEntity(Entity):
     """
     Row of data in the locations table.
     """
+    __slots__ = ("__country", "__region", "__city", "__latitude", "__longitude")
     __country:str
     __region:str
     __city:str
@@ -201,6 +292,7 @@ class LocationEntity(Entity):
         return self.__longitude
 
 class UserEntity(Entity, UserMixin):
+    __slots__ = ("__ID", "__name", "__email", "__password", "__role", "__camera")
     __ID: str
     __name:str
     __email: str
@@ -0,0 +1,119 @@
+from src.config import *
+from src.db.Entities import ReadingEntity
+from datetime import timedelta
+
+
+class ReadingFrame:
+    """
+    A batch of readings held column-wise in NumPy arrays instead of one ReadingEntity per row.
+    Timestamps are datetime64[s], measurements float32 with missing or unreadable values (-999) as NaN,
+    and the MAC of each row is a code into the categories array of distinct MACs.
+    Image paths are not carried.
+    """
+    __slots__ = ("timestamps", "codes", "categories", "temperature", "humidity", "pressure", "dewpoint")
+
+    __epoch:datetime = datetime(1970, 1, 1)
+    __second:timedelta = timedelta(seconds = 1)
+
+    def __init__(self, timestamps:np.ndarray, codes:np.ndarray, categories:np.ndarray, temperature:np.ndarray,
+                 humidity:np.ndarray, pressure:np.ndarray, dewpoint:np.ndarray):
+        self.timestamps = timestamps
+        self.codes = codes
+        self.categories = categories
+        self.temperature = temperature
+        self.humidity = humidity
+        self.pressure = pressure
+        self.dewpoint = dewpoint
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    @staticmethod
+    def datetime64(stamps:Sequence[datetime | int]) -> np.ndarray:
+        """
+        Convert naive datetimes, or integer seconds since the epoch, to datetime64[s].
+        Going through integer seconds is several times faster than letting NumPy convert the objects.
+        """
+        if len(stamps) and isinstance(stamps[0], datetime):
+            epoch, second = ReadingFrame.__epoch, ReadingFrame.__second
+            stamps = [(stamp - epoch) // second for stamp in stamps]
+        return np.array(stamps, dtype = np.int64).astype("datetime64[s]")
+
+    @staticmethod
+    def __measurement(rows:Sequence[Tuple], index:int) -> np.ndarray:
+        column = np.array([row[index] for row in rows], dtype = np.float32)
+        column[column == -999] = np.nan
+        return column
+
+    @staticmethod
+    def empty() -> "ReadingFrame":
+        floats = [np.empty(0, dtype = np.float32) for _ in range(4)]
+        return ReadingFrame(np.empty(0, dtype = "datetime64[s]"), np.empty(0, dtype = np.int32),
+                            np.empty(0, dtype = "U25"), *floats)
+
+    @staticmethod
+    def from_rows(rows:Sequence[Tuple]) -> "ReadingFrame":
+        """
+        Build a frame from cursor rows in ReadingService.COLUMNS order, where the timestamp
+        may also be given as integer seconds since the epoch. Trailing columns are ignored.
+        Columns are pulled out one at a time, transposing with zip(*rows) is several times slower.
+        """
+        if not rows: return ReadingFrame.empty()
+        macs = [row[1] for row in rows]
+        categories = {mac: code for code, mac in enumerate(dict.fromkeys(macs))}
+        codes = np.fromiter(map(categories.__getitem__, macs), dtype = np.int32, count = len(macs))
+
+        return ReadingFrame(ReadingFrame.datetime64([row[0] for row in rows]), codes,
+                            np.array(list(categories), dtype = "U25"),
+                            ReadingFrame.__measurement(rows, 2), ReadingFrame.__measurement(rows, 3),
+                            ReadingFrame.__measurement(rows, 4), ReadingFrame.__measurement(rows, 5))
+
+    @staticmethod
+    def from_entities(readings:Sequence[ReadingEntity]) -> "ReadingFrame":
+        return ReadingFrame.from_rows([(reading.get_timestamp(), reading.get_mac(), reading.get_temperature(),
+                                        reading.get_humidity(), reading.get_pressure(), reading.get_dewpoint())
+                                       for reading in readings])
+
+    @staticmethod
+    def concat(frames:Sequence["ReadingFrame"]) -> "ReadingFrame":
+        """
+        Join frames end to end, merging their MAC categories.
+        """
+        frames = [frame for frame in frames if len(frame)]
+        if not frames: return ReadingFrame.empty()
+        if len(frames) == 1: return frames[0]
+
+        categories:Dict[str, int] = {}
+        codes = []
+        for frame in frames:
+            remap = np.array([categories.setdefault(mac, len(categories)) for mac in frame.categories.tolist()], dtype = np.int32)
+            codes.append(remap[frame.codes])
+
+        return ReadingFrame(np.concatenate([frame.timestamps for frame in frames]),
+                            np.concatenate(codes),
+                            np.array(list(categories), dtype = "U25"),
+                            np.concatenate([frame.temperature for frame in frames]),
+                            np.concatenate([frame.humidity for frame in frames]),
+                            np.concatenate([frame.pressure for frame in frames]),
+                            np.concatenate([frame.dewpoint for frame in frames]))
+
+    def macs(self) -> np.ndarray:
+        """
+        MAC of every row.
+        """
+        return self.categories[self.codes]
+
+    def select(self, mask:np.ndarray) -> "ReadingFrame":
+        """
+        Rows where mask is True, or at the given indices.
+        """
+        return ReadingFrame(self.timestamps[mask], self.codes[mask], self.categories, self.temperature[mask],
+                            self.humidity[mask], self.pressure[mask], self.dewpoint[mask])
+
+    def device(self, MAC:str) -> "ReadingFrame":
+        """
+        Rows of one device.
+        """
+        found = np.flatnonzero(self.categories == MAC)
+        if not len(found): return ReadingFrame.empty()
+        return self.select(self.codes == found[0])
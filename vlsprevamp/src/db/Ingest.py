@@ -0,0 +1,187 @@
+from src.db.Services import *
+from queue import Queue, Empty, Full
+from threading import Thread, Event, Lock
+from time import monotonic
+import atexit
+
+class IngestQueue:
+    """
+    Static write-behind queue for readings and status heartbeats.
+    Handlers enqueue entities and return immediately. A background flusher drains the queue
+    in batches of INGEST_BATCH_SIZE rows or every INGEST_FLUSH_MS milliseconds, whichever comes first,
+    and writes each batch in a single transaction.
+    A batch that fails is split in halves and retried, so a bad row only loses itself.
+    """
+    __queue:Queue = Queue(maxsize = INGEST_QUEUE_SIZE)
+    __stop:Event = Event()
+    __thread:Thread | None = None
+    __lock:Lock = Lock()
+    __stats_lock:Lock = Lock()
+
+    __batch_size:int = INGEST_BATCH_SIZE
+    __flush_interval:float = INGEST_FLUSH_MS / 1000
+
+    # Counters for sizing the queue. Updated from request threads and the flusher, under the stats lock.
+    __enqueued:int = 0
+    __rejected:int = 0
+    __flushed:int = 0
+    __dropped:int = 0
+    __splits:int = 0
+    __flushes:int = 0
+    __flush_ms_total:float = 0.0
+    __flush_ms_last:float = 0.0
+    __flush_ms_max:float = 0.0
+
+    @staticmethod
+    def start() -> None:
+        """
+        Start the background flusher if it is not already running.
+        Remaining entries are flushed on interpreter shutdown.
+        """
+        with IngestQueue.__lock:
+            if IngestQueue.running(): return
+            IngestQueue.__stop.clear()
+            IngestQueue.__thread = Thread(target = IngestQueue.__run, name = "ingest-flusher", daemon = True)
+            IngestQueue.__thread.start()
+            atexit.register(IngestQueue.stop)
+        debug("Write-behind ingestion started.")
+
+    @staticmethod
+    def stop(timeout:float = 10.0) -> None:
+        """
+        Stop the flusher after it has written everything left in the queue.
+        """
+        with IngestQueue.__lock:
+            thread = IngestQueue.__thread
+            if thread is None: return
+            IngestQueue.__stop.set()
+            thread.join(timeout)
+            IngestQueue.__thread = None
+        debug("Write-behind ingestion stopped.")
+
+    @staticmethod
+    def running() -> bool:
+        thread = IngestQueue.__thread
+        return thread is not None and thread.is_alive()
+
+    @staticmethod
+    def put(entity:ReadingEntity | SensorEntity) -> bool:
+        """
+        Queue a reading or status for writing. Return False if the queue is full.
+        """
+        try:
+            IngestQueue.__queue.put_nowait(entity)
+            queued = True
+        except Full:
+            queued = False
+
+        with IngestQueue.__stats_lock:
+            if queued: IngestQueue.__enqueued += 1
+            else: IngestQueue.__rejected += 1
+        return queued
+
+    @staticmethod
+    def stats() -> Dict[str, int | float]:
+        """
+        Snapshot of the queue depth and flush counters.
+        """
+        with IngestQueue.__stats_lock:
+            flushes = IngestQueue.__flushes
+            return {
+                "running": IngestQueue.running(),
+                "depth": IngestQueue.__queue.qsize(),
+                "capacity": IngestQueue.__queue.maxsize,
+                "enqueued": IngestQueue.__enqueued,
+                "rejected": IngestQueue.__rejected,
+                "flushed": IngestQueue.__flushed,
+                "dropped": IngestQueue.__dropped,
+                "splits": IngestQueue.__splits,
+                "flushes": flushes,
+                "flush_ms_last": round(IngestQueue.__flush_ms_last, 3),
+                "flush_ms_max": round(IngestQueue.__flush_ms_max, 3),
+                "flush_ms_avg": round(IngestQueue.__flush_ms_total / flushes, 3) if flushes else 0.0
+            }
+
+    @staticmethod
+    def __run() -> None:
+        """
+        Flusher loop. Exits once stop is requested and the queue is drained.
+        """
+        queue = IngestQueue.__queue
+        while not (IngestQueue.__stop.is_set() and queue.empty()):
+            try:
+                batch = [queue.get(timeout = IngestQueue.__flush_interval)]
+            except Empty:
+                continue
+
+            deadline = monotonic() + IngestQueue.__flush_interval
+            while len(batch) < IngestQueue.__batch_size:
+                remaining = deadline - monotonic()
+                if remaining <= 0: break
+                try:
+                    batch.append(queue.get(timeout = remaining))
+                except Empty:
+                    break
+
+            IngestQueue.__flush(batch)
+
+        Manager.release()
+
+    @staticmethod
+    def __flush(batch:List[ReadingEntity | SensorEntity]) -> None:
+        """
+        Write one batch, isolating the rows that can't be written.
+        """
+        start = monotonic()
+        dropped, splits = IngestQueue.__store(batch)
+
+        elapsed = (monotonic() - start) * 1000
+        with IngestQueue.__stats_lock:
+            IngestQueue.__flushes += 1
+            IngestQueue.__flush_ms_last = elapsed
+            IngestQueue.__flush_ms_total += elapsed
+            IngestQueue.__flush_ms_max = max(IngestQueue.__flush_ms_max, elapsed)
+            IngestQueue.__flushed += len(batch) - dropped
+            IngestQueue.__dropped += dropped
+            IngestQueue.__splits += splits
+
+    @staticmethod
+    def __store(batch:List[ReadingEntity | SensorEntity]) -> Tuple[int, int]:
+        """
+        Write a batch in one transaction. If that fails, write each half the same way,
+        down to single rows, which are dropped if they still fail.
+        Return the number of rows dropped and of splits made.
+        """
+        if IngestQueue.__write(batch): return 0, 0
+        if len(batch) == 1:
+            debug(f"Dropped ingest row {batch[0].get_mac()} {batch[0].get_timestamp()} that couldn't be written.")
+            return 1, 0
+
+        middle = len(batch) // 2
+        first = IngestQueue.__store(batch[:middle])
+        second = IngestQueue.__store(batch[middle:])
+        return first[0] + second[0], first[1] + second[1] + 1
+
+    @staticmethod
+    def __write(batch:List[ReadingEntity | SensorEntity]) -> bool:
+        """
+        Write readings and statuses in a single transaction. Return True if it was committed.
+        """
+        readings = [entity for entity in batch if isinstance(entity, ReadingEntity)]
+        statuses = [entity for entity in batch if isinstance(entity, SensorEntity)]
+
+        try:
+            stored = ReadingService.upsert_many(readings, commit = False) and \
+                     StatusService.upsert_many(statuses, commit = False)
+            conn = Manager.get_conn()
+            if stored: conn.commit()
+            else: conn.rollback()
+            return stored
+
+        except Exception as e:
+            debug(f"Couldn't flush ingest batch -> {e}")
+            try:
+                Manager.get_conn().rollback()
+            except Exception:
+                pass
+            return False
@@ -0,0 +1,63 @@
+from src.config import *
+from src.db.Management import Manager
+from src.db.schema import maintain_partitions
+from threading import Thread, Event, Lock
+import mysql.connector as mysql
+
+
+class PartitionMaintenance:
+    """
+    Static background job keeping the Readings partitions current.
+    Once at start and then every PARTITION_INTERVAL seconds it creates the partitions for the coming
+    months and drops those past the retention period. Does nothing if Readings isn't partitioned.
+    The connection is returned to the pool between runs.
+    """
+    __stop:Event = Event()
+    __thread:Thread | None = None
+    __lock:Lock = Lock()
+
+    @staticmethod
+    def start() -> None:
+        """
+        Start the maintenance thread if it is not already running.
+        """
+        with PartitionMaintenance.__lock:
+            if PartitionMaintenance.running(): return
+            PartitionMaintenance.__stop.clear()
+            PartitionMaintenance.__thread = Thread(target = PartitionMaintenance.__run, name = "partition-maintenance", daemon = True)
+            PartitionMaintenance.__thread.start()
+
+    @staticmethod
+    def stop() -> None:
+        with PartitionMaintenance.__lock:
+            thread = PartitionMaintenance.__thread
+            if thread is None: return
+            PartitionMaintenance.__stop.set()
+            thread.join()
+            PartitionMaintenance.__thread = None
+
+    @staticmethod
+    def running() -> bool:
+        thread = PartitionMaintenance.__thread
+        return thread is not None and thread.is_alive()
+
+    @staticmethod
+    def run() -> None:
+        """
+        Maintain the partitions once in the calling thread.
+        """
+        try:
+            maintain_partitions(Manager.get_conn())
+        except mysql.Error as e:
+            debug(f"Couldn't maintain reading partitions -> {e}")
+        finally:
+            Manager.release()
+
+    @staticmethod
+    def __run() -> None:
+        while True:
+            try:
+                PartitionMaintenance.run()
+            except Exception as e:
+                debug(f"Couldn't maintain reading partitions -> {e}")
+            if PartitionMaintenance.__stop.wait(PARTITION_INTERVAL): break
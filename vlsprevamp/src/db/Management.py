@@ -1,22 +1,70 @@
 from src.config import *
 import mysql.connector as mysql
+from mysql.connector.pooling import MySQLConnectionPool, PooledMySQLConnection, CNX_POOL_MAXSIZE
+from mysql.connector.errors import PoolError
 from src.db.schema import apply
+from src.db.Timing import TimedConnection
+from threading import Lock, local
+from time import monotonic, sleep
 
 class Manager:
     """
-    Static Database Manager.
+    Static pooled Database Manager.
+    Each thread checks a connection out of the pool on first use and keeps it until it calls
+    release(). The app calls release() when a request's context tears down, so request threads
+    hand their connection back after every request, and background workers when they stop.
     """
-    __conn:mysql.MySQLConnection = None
+    __pool:MySQLConnectionPool = None
     __config_path:str = DB_CONFIG
+    __local:local = local()
+    __lock:Lock = Lock()
+    __in_use:int = 0
+
+    # When each pooled connection, by its server connection id, was last returned to the pool.
+    __last_used:Dict[int, float] = {}
+
+    # Idle connections older than this are pinged, and reconnected if needed, before use.
+    __liveness_interval:float = 30.0
+    __pool_timeout:float = 5.0
+
+    @staticmethod
+    def get_conn() -> PooledMySQLConnection | TimedConnection:
+        """
+        Get the database connection bound to the current thread.
+        """
+        conn = getattr(Manager.__local, "conn", None)
+        if conn is None:
+            conn = Manager.__checkout()
+            Manager.__local.conn = conn
+        return conn
+
+    @staticmethod
+    def release(exc:BaseException | None = None) -> None:
+        """
+        Return the connection bound to the current thread to the pool.
+        Registered as an app context teardown handler.
+        """
+        conn = getattr(Manager.__local, "conn", None)
+        Manager.__local.conn = None
+        if conn is None: return
+
+        try:
+            with Manager.__lock:
+                Manager.__last_used[conn.connection_id] = monotonic()
+            conn.close()
+        except mysql.Error as e:
+            debug(f"Couldn't return connection to pool -> {e}")
+        finally:
+            with Manager.__lock:
+                Manager.__in_use -= 1
 
     @staticmethod
-    def get_conn():
+    def stats() -> Dict[str, int]:
         """
-        Get database connection object to write to local db.
+        Size of the pool and how many connections are checked out.
         """
-        if not Manager.__conn: Manager.__connect()
-        return Manager.__conn
-    
+        pool = Manager.__pool
+        return {"size": pool.pool_size if pool else 0, "in_use": Manager.__in_use}
 
     @staticmethod
     def get_config_path() -> str:
@@ -27,35 +75,96 @@ class Manager:
 
 
     @staticmethod
-    def connect(drop_schema:bool = False) -> None:
+    def connect(drop_schema:bool = False, migrate:bool = MIGRATE_SCHEMA) -> None:
         """
-        Connect to database specified in the 
+        Create the connection pool for the database specified in the config, creating the schema
+        first if the database doesn't exist. With migrate, the schema is also re-applied to an
+        existing database, picking up tables and columns added since it was created.
         """
         conf_dict = Manager.__load(Manager.__config_path)
-        if conf_dict is None: raise RuntimeError(str(e) + " -> Couldn't read database config file.")
+        if conf_dict is None: raise RuntimeError("Couldn't read database config file.")
+
+        try:
+            # The schema is applied over a plain connection since the database may not exist yet.
+            conn = mysql.connect(
+                user = conf_dict['user'],
+                password = conf_dict['pass'],
+                host = conf_dict['host'])
+            Manager.apply_schema(conn, drop_schema, migrate)
+            conn.close()
+
+        except mysql.Error as e:
+            raise RuntimeError(str(e) + " -> Couldn't connect to db 'weather'.")
+
+        with Manager.__lock:
+            Manager.__create_pool(conf_dict)
+
+    @staticmethod
+    def __create_pool(conf_dict:Dict | None = None) -> None:
+        """
+        Create the connection pool, without touching the schema. Must hold the lock.
+        """
+        if conf_dict is None: conf_dict = Manager.__load(Manager.__config_path)
+        if conf_dict is None: raise RuntimeError("Couldn't read database config file.")
 
         username =  conf_dict['user']
         passw = conf_dict['pass']
         hostname = conf_dict['host']
+        pool_size = min(max(int(conf_dict.get('pool_size', 8)), 1), CNX_POOL_MAXSIZE)
+        Manager.__pool_timeout = float(conf_dict.get('pool_timeout', Manager.__pool_timeout))
 
         try:
-            Manager.__conn = mysql.connect(
+            Manager.__pool = MySQLConnectionPool(
+                pool_name = "weather",
+                pool_size = pool_size,
+                pool_reset_session = True,
                 user = username,
                 password = passw,
-                host = hostname)
+                host = hostname,
+                database = "weather")
+            debug(f"successfully connected to the database with a pool of {pool_size}")
 
-            Manager.apply_schema(drop_schema)
+        except mysql.Error as e:
+            Manager.__pool = None
+            raise RuntimeError(str(e) + " -> Couldn't connect to db 'weather'.")
 
-            cursor = Manager.__conn.cursor()
-            cursor.execute("USE weather")
-            cursor.close()
-            debug("successfully connected to the database")
+    @staticmethod
+    def __checkout() -> PooledMySQLConnection | TimedConnection:
+        """
+        Take a connection from the pool, waiting up to the pool timeout for one to free up.
+        Connections idle for longer than the liveness interval are pinged and reconnected if dead.
+        With QUERY_TIMING on, the connection is wrapped so every statement is timed.
+        """
+        if Manager.__pool is None:
+            with Manager.__lock:
+                if Manager.__pool is None: Manager.__create_pool()
+
+        deadline = monotonic() + Manager.__pool_timeout
+        while True:
+            try:
+                conn = Manager.__pool.get_connection()
+                break
+            except PoolError:
+                if monotonic() > deadline:
+                    raise RuntimeError("Timed out waiting for a database connection from the pool.")
+                sleep(0.01)
 
+        with Manager.__lock:
+            Manager.__in_use += 1
+
+        try:
+            with Manager.__lock:
+                last_used = Manager.__last_used.pop(conn.connection_id, 0.0)
+            if monotonic() - last_used > Manager.__liveness_interval:
+                conn.ping(reconnect = True, attempts = 3, delay = 1)
         except mysql.Error as e:
-            Manager.__conn = None
-            raise RuntimeError(str(e) + " -> Couldn't connect to db 'weather'.")
+            with Manager.__lock:
+                Manager.__in_use -= 1
+            conn.close()
+            raise RuntimeError(str(e) + " -> Couldn't reconnect to db 'weather'.")
+
+        return TimedConnection(conn) if QUERY_TIMING else conn
 
-    
     @staticmethod
     def __load(file_path:str) -> Dict | None:
         """
@@ -78,14 +187,14 @@ class Manager:
 
 
     @staticmethod
-    def apply_schema(should_drop_schema:bool):
+    def apply_schema(conn:mysql.MySQLConnection, should_drop_schema:bool, migrate:bool = False):
         """
-        Apply the schema to the Database.
+        Apply the schema to the Database if it is new, dropped, or migrate is given.
         """
         exists = False
 
         try:
-            cursor = Manager.__conn.cursor()
+            cursor = conn.cursor()
             cursor.execute("SHOW DATABASES LIKE 'weather'")
             result = cursor.fetchone()
             exists = result is not None
@@ -95,14 +204,16 @@ class Manager:
 
         if should_drop_schema and exists:
             try:
-                cursor = Manager.__conn.cursor()
+                cursor = conn.cursor()
                 cursor.execute("DROP DATABASE weather")
                 cursor.close()
             except mysql.Error:
                 raise RuntimeError("Couldn't drop DB 'weather'")
 
-        if should_drop_schema or not exists:
+        if should_drop_schema or not exists or migrate:
+            # Every table is created with IF NOT EXISTS, so applying is safe on an existing
+            # database and picks up tables added since it was created.
             try:
-                apply(Manager.__conn)
+                apply(conn)
             except Exception as e:
                 raise RuntimeError(str(e) + " -> Couldn't load schema for Database: 'weather.'")
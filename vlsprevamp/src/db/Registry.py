@@ -0,0 +1,67 @@
+from src.db.Entities import DeviceEntity
+from src.config import *
+from threading import Lock
+from time import monotonic
+from typing import Callable
+
+class DeviceRegistry:
+    """
+    Static in-process cache of the Devices table.
+    The fleet rarely changes, so device lookups on the ingest path are answered from memory.
+    The cache is reloaded when invalidated by a device write, or after the TTL runs out.
+    Every invalidation bumps a generation counter, and a reload that started before one
+    doesn't mark the cache fresh, since it may have missed the write.
+    """
+    __devices:Dict[str, DeviceEntity] = {}
+    __loaded_at:float | None = None
+    __ttl:float = DEVICE_CACHE_TTL
+    __lock:Lock = Lock()
+    __generation:int = 0
+    __generation_lock:Lock = Lock()
+
+    @staticmethod
+    def stale() -> bool:
+        """
+        Return True if the cache was never loaded, was invalidated or has outlived its TTL.
+        """
+        loaded_at = DeviceRegistry.__loaded_at
+        return loaded_at is None or (monotonic() - loaded_at) > DeviceRegistry.__ttl
+
+    @staticmethod
+    def ensure(loader:Callable[[], List[DeviceEntity] | None]) -> None:
+        """
+        Reload the cache through the loader if it is stale.
+        Only one thread reloads at a time. If the loader fails the previous contents are kept.
+        """
+        if not DeviceRegistry.stale(): return
+
+        with DeviceRegistry.__lock:
+            if not DeviceRegistry.stale(): return
+            generation = DeviceRegistry.__generation
+            devices = loader()
+            if devices is None: return
+            with DeviceRegistry.__generation_lock:
+                DeviceRegistry.__devices = {device.get_mac(): device for device in devices}
+                if generation == DeviceRegistry.__generation:
+                    DeviceRegistry.__loaded_at = monotonic()
+
+    @staticmethod
+    def invalidate() -> None:
+        """
+        Mark the cache as stale so the next lookup reloads it, including when a reload is in progress.
+        """
+        with DeviceRegistry.__generation_lock:
+            DeviceRegistry.__generation += 1
+            DeviceRegistry.__loaded_at = None
+
+    @staticmethod
+    def get(MAC:str) -> DeviceEntity | None:
+        return DeviceRegistry.__devices.get(MAC)
+
+    @staticmethod
+    def contains(MAC:str) -> bool:
+        return MAC in DeviceRegistry.__devices
+
+    @staticmethod
+    def size() -> int:
+        return len(DeviceRegistry.__devices)
@@ -1,10 +1,67 @@
 import mysql.connector as mysql
 from src.db.Entities import *
 from src.db.Management import Manager
+from src.db.Registry import DeviceRegistry
+from src.db.Frame import ReadingFrame
 from src.config import debug
 from abc import ABC
 from src.config import *
 from uuid import uuid4
+from datetime import timedelta
+
+
+def _fetch_chunks(query_string:str, params:Tuple = (), batch_size:int = FETCH_CHUNK_ROWS,
+                  dictionary:bool = True, what:str = "rows") -> Generator[List, None, None]:
+    """
+    Run a query on an unbuffered cursor and yield its rows batch_size at a time.
+    The connection of the current request or thread can't run other statements until the
+    generator is exhausted or closed. Rows left unread when the consumer stops early are still read
+    off the wire and discarded, so closing early costs as much as reading on; only use it for tables
+    that stay small, and page large ones with _fetch_page as ReadingService.iter_chunks does.
+    A database error part way through is logged and re-raised, so a consumer streaming the rows
+    out aborts rather than ending early as if the range were complete.
+    """
+    conn = Manager.get_conn()
+    cursor = None
+    try:
+        cursor = conn.cursor(dictionary=dictionary)
+        cursor.execute(query_string, params)
+
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows: break
+            yield rows
+
+    except mysql.Error as e:
+        debug(f"Couldn't fetch {what} -> {e}")
+        raise
+
+    finally:
+        if cursor:
+            try:
+                conn.consume_results()
+                cursor.close()
+            except mysql.Error as e:
+                debug(f"Couldn't close the {what} cursor -> {e}")
+
+
+def _fetch_page(query_string:str, params:Tuple = (), what:str = "rows") -> List[Tuple]:
+    """
+    Run a bounded query on a buffered cursor and return all its rows.
+    A database error is logged and re-raised, as in _fetch_chunks.
+    """
+    cursor = None
+    try:
+        cursor = Manager.get_conn().cursor(buffered=True)
+        cursor.execute(query_string, params)
+        return cursor.fetchall()
+
+    except mysql.Error as e:
+        debug(f"Couldn't fetch {what} -> {e}")
+        raise
+
+    finally:
+        if cursor: cursor.close()
 
 
 class Service(ABC):
@@ -12,6 +69,10 @@ class Service(ABC):
     def get_all() -> List[Entity]:
         pass
 
+    @staticmethod
+    def iter_all(batch_size:int = FETCH_CHUNK_ROWS) -> Generator[Entity, None, None]:
+        pass
+
     @staticmethod
     def get(MAC:str, *args) -> List[Entity]:
         pass
@@ -36,6 +97,31 @@ class Service(ABC):
 class DeviceService(Service):
     @staticmethod
     def get_all() -> List[DeviceEntity]:
+        devices = DeviceService.__fetch_all()
+        return devices if devices is not None else []
+
+    @staticmethod
+    def iter_all(batch_size:int = FETCH_CHUNK_ROWS) -> Generator[DeviceEntity, None, None]:
+        """
+        Yield every device straight from the database, batch_size rows at a time.
+        """
+        for rows in _fetch_chunks("SELECT * FROM Devices;", batch_size = batch_size, what = "device list"):
+            for row in rows:
+                yield DeviceEntity(
+                    row["MAC"],
+                    row["name"],
+                    row["device_model"],
+                    row["camera_model"],
+                    row["altitude"],
+                    row["latitude"],
+                    row["longitude"]
+                )
+
+    @staticmethod
+    def __fetch_all() -> List[DeviceEntity] | None:
+        """
+        Read every device from the database. Return None if the query failed.
+        """
         query_string = "SELECT * FROM Devices;"
         devices = []
         cursor = None
@@ -57,14 +143,34 @@ class DeviceService(Service):
 
         except mysql.Error as e:
             debug(f"Couldn't fetch device list -> {e}")
+            devices = None
 
         finally:
             if cursor: cursor.close()
 
         return devices
 
+    @staticmethod
+    def refresh() -> None:
+        """
+        Force the device registry to reload from the database.
+        """
+        DeviceRegistry.invalidate()
+        DeviceRegistry.ensure(DeviceService.__fetch_all)
+
     @staticmethod
     def get(MAC:str) -> DeviceEntity | None:
+        """
+        Look up a device in the in-process registry, reloading it first if stale.
+        """
+        DeviceRegistry.ensure(DeviceService.__fetch_all)
+        return DeviceRegistry.get(MAC)
+
+    @staticmethod
+    def fetch(MAC:str) -> DeviceEntity | None:
+        """
+        Read a device straight from the database, bypassing the registry.
+        """
         query_string = "SELECT * FROM Devices WHERE MAC=%s LIMIT 1;"
         device = None
         cursor = None
@@ -105,6 +211,7 @@ class DeviceService(Service):
             )
 
             conn.commit()
+            DeviceRegistry.invalidate()
 
         except mysql.Error as e:
             debug(f"Couldn't insert device record -> {e}")
@@ -121,6 +228,7 @@ class DeviceService(Service):
             cursor = conn.cursor()
             cursor.execute(update_string, (name, MAC))
             conn.commit()
+            DeviceRegistry.invalidate()
             #debug("Updated database record!")
         except mysql.Error as e:
             debug(f"Couldn't update device name -> {e}")
@@ -130,56 +238,170 @@ class DeviceService(Service):
                 cursor.close()
 
     @staticmethod
-    def exists(MAC:str) -> bool:
-        query_string = "SELECT * FROM Devices WHERE MAC=%s LIMIT 1;"
+    def upsert(MAC:str, name:str, dev_model:str, cam_model:str, altitude:float, latitude:float, longitude:float) -> bool:
+        """
+        Insert a device or overwrite the existing record in a single statement.
+        """
+        conn = Manager.get_conn()
+        upsert_string = "INSERT INTO Devices (MAC, name, device_model, camera_model, altitude, latitude, longitude) " + \
+                        "VALUES(%s, %s, %s, %s, %s, %s, %s) ON DUPLICATE KEY UPDATE name=VALUES(name), " + \
+                        "device_model=VALUES(device_model), camera_model=VALUES(camera_model), " + \
+                        "altitude=VALUES(altitude), latitude=VALUES(latitude), longitude=VALUES(longitude);"
         cursor = None
-        # If no device is retrieved, return False.
-        device:bool = False
-
+        stored = False
         try:
-            cursor = Manager.get_conn().cursor(dictionary=True)
-            cursor.execute(query_string, (MAC,))
-            device = cursor.fetchone() is not None
+            cursor = conn.cursor()
+            cursor.execute(
+                upsert_string, (MAC, name, dev_model, cam_model, altitude, latitude, longitude)
+            )
+            conn.commit()
+            DeviceRegistry.invalidate()
+            stored = True
 
         except mysql.Error as e:
-            debug(f"Couldn't check for existence of device record -> {e}")
-            return False
+            debug(f"Couldn't upsert device record -> {e}")
 
         finally:
             if cursor: cursor.close()
 
-        return device
+        return stored
+
+    @staticmethod
+    def exists(MAC:str) -> bool:
+        """
+        Check the in-process registry for a device, reloading it first if stale.
+        """
+        DeviceRegistry.ensure(DeviceService.__fetch_all)
+        return DeviceRegistry.contains(MAC)
 
 
 class ReadingService(Service):
     @staticmethod
     def get_all() -> List[ReadingEntity]:
-        query_string = "SELECT * FROM Readings;"
-        readings = []
-        cursor = None
         try:
-            cursor = Manager.get_conn().cursor(dictionary=True)
-            cursor.execute(query_string)
+            return list(ReadingService.iter_all())
+        except mysql.Error:
+            return []
 
-            for row in cursor.fetchall():
-                reading = ReadingEntity(
-                    row["MAC"],
-                    row["temperature"],
-                    row["relative_humidity"],
-                    row["pressure"],
-                    row["dewpoint"],
-                    row["timestamp"],
-                    row["filepath"]
-                )
-                readings.append(reading)
+    @staticmethod
+    def iter_all(batch_size:int = FETCH_CHUNK_ROWS) -> Generator[ReadingEntity, None, None]:
+        """
+        Yield every reading, by device then time, batch_size rows at a time.
+        """
+        return ReadingService.__entities(ReadingService.iter_chunks(chunk_size = batch_size))
+
+    @staticmethod
+    def __entities(chunks:Generator[List[Tuple], None, None]) -> Generator[ReadingEntity, None, None]:
+        for rows in chunks:
+            for timestamp, mac, temp, hum, pres, dew, filepath, lcl in rows:
+                yield ReadingEntity(mac, temp, hum, pres, dew, timestamp, filepath, lcl)
+
+    # Column order of the rows yielded by iter_chunks.
+    COLUMNS:Tuple[str, ...] = ("timestamp", "MAC", "temperature", "relative_humidity", "pressure", "dewpoint", "filepath", "lcl_m")
+
+    # Frames take the timestamp as integer epoch seconds, sparing the connector a datetime object per row.
+    __frame_columns:Tuple[str, ...] = ("TIMESTAMPDIFF(SECOND, '1970-01-01 00:00:00', timestamp)", "MAC", "temperature",
+                                       "relative_humidity", "pressure", "dewpoint")
+
+    @staticmethod
+    def __range(MAC:str | None, start:datetime | None, end:datetime | None, after:datetime | None = None) -> Tuple[str, List[Any]]:
+        """
+        WHERE clause and parameters selecting a device and time range.
+        """
+        conditions = ["1=1"]
+        params:List[Any] = []
+        for condition, value in (("MAC=%s", MAC), ("timestamp>=%s", start), ("timestamp<%s", end), ("timestamp>%s", after)):
+            if value is None: continue
+            conditions.append(condition)
+            params.append(value)
+        return " AND ".join(conditions), params
+
+    @staticmethod
+    def iter_chunks(MAC:str | None = None, start:datetime | None = None, end:datetime | None = None, after:datetime | None = None,
+                    limit:int | None = None, chunk_size:int = FETCH_CHUNK_ROWS,
+                    columns:Sequence[str] = COLUMNS) -> Generator[List[Tuple], None, None]:
+        """
+        Yield readings with start <= timestamp < end as lists of up to chunk_size row tuples of the given
+        columns, COLUMNS by default, ordered by device then time. Without a MAC every device is included.
+        after is the keyset cursor: only readings strictly later than it are returned, so a page
+        resumes where the previous one ended without OFFSET rescanning the skipped rows.
+        Each chunk is its own query of at most chunk_size rows, resuming from the (MAC, timestamp) key
+        of the previous chunk's last row, so memory use does not grow with the size of the range and a
+        consumer that stops early, such as a disconnected client, leaves no unread rows to drain.
+        """
+        conditions, params = ReadingService.__range(MAC, start, end, after)
+
+        # The key columns are selected too if the caller didn't ask for them, and cut off again.
+        selected = list(columns) + [key for key in ("MAC", "timestamp") if key not in columns]
+        width = len(columns)
+        mac_at, timestamp_at = selected.index("MAC"), selected.index("timestamp")
+
+        # Every chunk is served by the (MAC, timestamp) primary key as a range scan from the last key.
+        select = f"SELECT {', '.join(selected)} FROM Readings WHERE {conditions}"
+        remaining = None if limit is None else int(limit)
+        last = None
+        while remaining is None or remaining > 0:
+            size = chunk_size if remaining is None else min(chunk_size, remaining)
+            query_string, page_params = select, list(params)
+            if last is not None:
+                query_string += " AND (MAC>%s OR (MAC=%s AND timestamp>%s))"
+                page_params += [last[0], last[0], last[1]]
+            query_string += " ORDER BY MAC, timestamp LIMIT %s;"
+
+            rows = _fetch_page(query_string, tuple(page_params) + (size,), what = "reading range")
+            if not rows: return
+            last = (rows[-1][mac_at], rows[-1][timestamp_at])
+            yield rows if len(selected) == width else [row[:width] for row in rows]
+
+            if len(rows) < size: return
+            if remaining is not None: remaining -= len(rows)
+
+    @staticmethod
+    def iter_range(MAC:str, start:datetime | None = None, end:datetime | None = None, after:datetime | None = None,
+                   limit:int | None = None, chunk_size:int = FETCH_CHUNK_ROWS) -> Generator[ReadingEntity, None, None]:
+        """
+        Yield the readings of one device with start <= timestamp < end, oldest first.
+        See iter_chunks for the after cursor and memory use.
+        """
+        return ReadingService.__entities(ReadingService.iter_chunks(MAC, start, end, after, limit, chunk_size))
+
+    @staticmethod
+    def iter_frames(MAC:str | None = None, start:datetime | None = None, end:datetime | None = None,
+                    chunk_size:int = EXPORT_CHUNK_ROWS) -> Generator[ReadingFrame, None, None]:
+        """
+        Yield the readings with start <= timestamp < end as one ReadingFrame per chunk,
+        without building an entity per row.
+        """
+        for rows in ReadingService.iter_chunks(MAC, start, end, chunk_size = chunk_size, columns = ReadingService.__frame_columns):
+            yield ReadingFrame.from_rows(rows)
+
+    @staticmethod
+    def frame(MAC:str | None = None, start:datetime | None = None, end:datetime | None = None) -> ReadingFrame:
+        """
+        The readings with start <= timestamp < end as a single ReadingFrame.
+        """
+        return ReadingFrame.concat(list(ReadingService.iter_frames(MAC, start, end)))
+
+    @staticmethod
+    def count(MAC:str | None = None, start:datetime | None = None, end:datetime | None = None) -> int:
+        """
+        Number of readings with start <= timestamp < end, for one device or all of them.
+        """
+        conditions, params = ReadingService.__range(MAC, start, end)
+        count = 0
+        cursor = None
+        try:
+            cursor = Manager.get_conn().cursor(buffered=True)
+            cursor.execute(f"SELECT COUNT(*) FROM Readings WHERE {conditions};", tuple(params))
+            count = cursor.fetchone()[0]
 
         except mysql.Error as e:
-            debug(f"Couldn't fetch reading data list -> {e}")
+            debug(f"Couldn't count readings -> {e}")
 
         finally:
             if cursor: cursor.close()
 
-        return readings
+        return count
 
     @staticmethod
     def get(MAC:str, timestamp:str) -> ReadingEntity | None:
@@ -201,7 +423,8 @@ class ReadingService(Service):
                     row["pressure"],
                     row["dewpoint"],
                     row["timestamp"],
-                    row["filepath"]
+                    row["filepath"],
+                    row["lcl_m"]
                 )
 
         except mysql.Error as e:
@@ -213,24 +436,169 @@ class ReadingService(Service):
         return reading
 
     @staticmethod
-    def add(MAC:str, temp:float, hum:float, pres:float, dew:float, timestamp:str, filepath:str = "") -> None:
+    def add(MAC:str, temp:float, hum:float, pres:float, dew:float, timestamp:str, filepath:str = "", lcl:float = None) -> None:
         conn = Manager.get_conn()
-        insert_string = "INSERT INTO Readings VALUES(%s, %s, %s, %s, %s, %s, %s);"
+        insert_string = "INSERT INTO Readings (timestamp, MAC, temperature, relative_humidity, pressure, dewpoint, filepath, lcl_m) " + \
+                        "VALUES(%s, %s, %s, %s, %s, %s, %s, %s);"
         cursor = None
         try:
             cursor = conn.cursor()
             cursor.execute(
-                insert_string, (timestamp, MAC, temp, hum, pres, dew, filepath)
+                insert_string, (timestamp, MAC, temp, hum, pres, dew, filepath, lcl)
             )
+            if ROLLUPS_ON_WRITE: RollupService.refresh(cursor, [(MAC, timestamp)])
 
             conn.commit()
 
         except mysql.Error as e:
             debug(f"Couldn't insert sensor reading record -> {e}")
+            conn.rollback()
 
         finally:
             if cursor: cursor.close()
 
+    @staticmethod
+    def upsert(MAC:str, timestamp:str, temp:float = None, hum:float = None, pres:float = None,
+               dew:float = None, filepath:str = None, lcl:float = None) -> bool:
+        """
+        Insert or update a reading in a single statement.
+        Only the columns given a value are written, so an image upload only touches the filepath
+        and a sensor reading never clobbers an existing image path.
+        The LCL is written along with any measurement, so it never outlives the values it came from.
+        """
+        columns = {
+            "temperature": temp,
+            "relative_humidity": hum,
+            "pressure": pres,
+            "dewpoint": dew,
+            "filepath": filepath
+        }
+        columns = {column: value for column, value in columns.items() if value is not None}
+        if columns.keys() - {"filepath"}: columns["lcl_m"] = lcl
+
+        names = ["timestamp", "MAC"] + list(columns.keys())
+        updates = ", ".join(f"{column}=VALUES({column})" for column in columns) if columns else "MAC=MAC"
+        upsert_string = f"INSERT INTO Readings ({', '.join(names)}) VALUES({', '.join(['%s'] * len(names))}) " + \
+                        f"ON DUPLICATE KEY UPDATE {updates};"
+
+        conn = Manager.get_conn()
+        cursor = None
+        stored = False
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                upsert_string, (timestamp, MAC, *columns.values())
+            )
+            if ROLLUPS_ON_WRITE and columns.keys() - {"filepath"}:
+                RollupService.refresh(cursor, [(MAC, timestamp)])
+            conn.commit()
+            stored = True
+
+        except mysql.Error as e:
+            debug(f"Couldn't upsert sensor reading record -> {e}")
+            conn.rollback()
+
+        finally:
+            if cursor: cursor.close()
+
+        return stored
+
+    @staticmethod
+    def upsert_many(readings:List[ReadingEntity], commit:bool = True) -> bool:
+        """
+        Insert or update a batch of readings with a single multi-row statement.
+        On conflict only the measurement columns are overwritten, the image path is left untouched.
+        Pass commit=False to leave the transaction open for the caller.
+        """
+        if not readings: return True
+        conn = Manager.get_conn()
+        upsert_string = "INSERT INTO Readings (timestamp, MAC, temperature, relative_humidity, pressure, dewpoint, filepath, lcl_m) " + \
+                        "VALUES(%s, %s, %s, %s, %s, %s, %s, %s) ON DUPLICATE KEY UPDATE temperature=VALUES(temperature), " + \
+                        "relative_humidity=VALUES(relative_humidity), pressure=VALUES(pressure), dewpoint=VALUES(dewpoint), " + \
+                        "lcl_m=VALUES(lcl_m);"
+        values = [(reading.get_timestamp(), reading.get_mac(), reading.get_temperature(), reading.get_humidity(),
+                   reading.get_pressure(), reading.get_dewpoint(), reading.get_image_path(), reading.get_lcl())
+                  for reading in readings]
+        cursor = None
+        stored = False
+        try:
+            # The connector rewrites an INSERT executemany into one multi-row statement.
+            cursor = conn.cursor()
+            cursor.executemany(upsert_string, values)
+            if ROLLUPS_ON_WRITE: RollupService.refresh(cursor, [(value[1], value[0]) for value in values])
+            if commit: conn.commit()
+            stored = True
+
+        except mysql.Error as e:
+            debug(f"Couldn't insert sensor reading batch -> {e}")
+            conn.rollback()
+
+        finally:
+            if cursor: cursor.close()
+
+        return stored
+
+    @staticmethod
+    def missing_lcl(after:Tuple[str, datetime] | None = None, limit:int = FETCH_CHUNK_ROWS) -> List[Tuple]:
+        """
+        The next limit readings without an LCL, in primary key order after the (MAC, timestamp) key given,
+        as (timestamp, MAC, temperature, relative_humidity, pressure, dewpoint) rows.
+        Each call is a fresh range scan from the key, so the caller can write between chunks.
+        """
+        conditions = "lcl_m IS NULL"
+        params:Tuple = ()
+        if after is not None:
+            conditions += " AND (MAC>%s OR (MAC=%s AND timestamp>%s))"
+            params = (after[0], after[0], after[1])
+
+        query_string = "SELECT timestamp, MAC, temperature, relative_humidity, pressure, dewpoint FROM Readings " + \
+                       f"WHERE {conditions} ORDER BY MAC, timestamp LIMIT %s;"
+        rows = []
+        cursor = None
+        try:
+            cursor = Manager.get_conn().cursor()
+            cursor.execute(query_string, params + (int(limit),))
+            rows = cursor.fetchall()
+
+        except mysql.Error as e:
+            debug(f"Couldn't fetch readings missing an LCL -> {e}")
+
+        finally:
+            if cursor: cursor.close()
+
+        return rows
+
+    @staticmethod
+    def update_lcl_many(values:List[Tuple[float, Any, str]]) -> int | None:
+        """
+        Store the LCL of many existing readings, given as (lcl_m, timestamp, MAC), in one statement
+        joining Readings against the values. Only readings still without an LCL are touched, so a reading
+        deleted since it was read isn't brought back and one given an LCL by ingest meanwhile isn't overwritten.
+        Return the number of readings updated, None if the write failed.
+        """
+        if not values: return 0
+        conn = Manager.get_conn()
+        rows = " UNION ALL ".join(["SELECT %s AS lcl, %s AS ts, %s AS mac"] + ["SELECT %s, %s, %s"] * (len(values) - 1))
+        update_string = f"UPDATE Readings r JOIN ({rows}) v ON r.timestamp=v.ts AND r.MAC=v.mac " + \
+                        "SET r.lcl_m=v.lcl WHERE r.lcl_m IS NULL;"
+        cursor = None
+        updated = None
+        try:
+            cursor = conn.cursor()
+            cursor.execute(update_string, tuple(param for value in values for param in value))
+            updated = max(cursor.rowcount, 0)
+            conn.commit()
+
+        except mysql.Error as e:
+            debug(f"Couldn't store reading LCL batch -> {e}")
+            conn.rollback()
+            updated = None
+
+        finally:
+            if cursor: cursor.close()
+
+        return updated
+
     @staticmethod
     def update_path(MAC:str, timestamp:str, filepath:str):
         conn = Manager.get_conn()
@@ -251,20 +619,22 @@ class ReadingService(Service):
             if cursor: cursor.close()
     
     @staticmethod
-    def update_readings(MAC:str, temp:float, hum:float, pres:float, dew:float, timestamp:str):
+    def update_readings(MAC:str, temp:float, hum:float, pres:float, dew:float, timestamp:str, lcl:float = None):
         conn = Manager.get_conn()
-        update_string = "UPDATE Readings SET temperature=%s, relative_humidity=%s,pressure=%s,dewpoint=%s WHERE MAC=%s AND timestamp=%s;"
+        update_string = "UPDATE Readings SET temperature=%s, relative_humidity=%s,pressure=%s,dewpoint=%s,lcl_m=%s WHERE MAC=%s AND timestamp=%s;"
         cursor = None
         try:
             cursor = conn.cursor()
             cursor.execute(
-                update_string, (temp, hum, pres, dew, MAC, timestamp)
+                update_string, (temp, hum, pres, dew, lcl, MAC, timestamp)
             )
+            if ROLLUPS_ON_WRITE: RollupService.refresh(cursor, [(MAC, timestamp)])
 
             conn.commit()
         
         except mysql.Error as e:
             debug(f"Couldn't update sensor reading record -> {e}")
+            conn.rollback()
 
         finally:
             if cursor: cursor.close()
@@ -291,18 +661,181 @@ class ReadingService(Service):
         return reading
 
 
-class StatusService(Service):
+class RollupService(Service):
+    """
+    Hourly and daily per-device aggregates of the readings.
+    A bucket is always recomputed from its source rows rather than adjusted by a delta,
+    so overwriting a reading or running a rebuild twice leaves the rollups exact.
+    Hourly buckets are aggregated from Readings, daily buckets from the hourly ones.
+    """
+    __measurements:Tuple[str, ...] = ("temperature", "relative_humidity", "pressure", "dewpoint")
+    __tables:Dict[str, str] = {"hour": "ReadingsHourly", "day": "ReadingsDaily"}
+
+    # Start of the hour a timestamp falls in. Written without DATE_FORMAT so no '%' clashes with the parameters.
+    __hour_start:str = "TIMESTAMP(DATE({0}), MAKETIME(HOUR({0}), 0, 0))"
+
     @staticmethod
-    def get_all() -> List[SensorEntity]:
-        query_string = "SELECT * FROM Status;"
-        statuses = []
+    def __upsert(table:str, source:str, bucket:str, aggregates:str, conditions:str) -> str:
+        columns = ", ".join(f"{column}_n, {column}_min, {column}_max, {column}_sum" for column in RollupService.__measurements)
+        updates = ", ".join(f"{column}=VALUES({column})" for column in ["samples"] + columns.split(", "))
+        return f"INSERT INTO {table} (bucket, MAC, samples, {columns}) " + \
+               f"SELECT {bucket} AS rollup_bucket, MAC, {aggregates} FROM {source} WHERE {conditions} " + \
+               f"GROUP BY MAC, rollup_bucket ON DUPLICATE KEY UPDATE {updates};"
+
+    @staticmethod
+    def __hourly(conditions:str) -> str:
+        # -999 is what handlers store for a value the device couldn't read.
+        aggregates = ", ".join(f"COUNT(CASE WHEN {column}<>-999 THEN {column} END), "
+                               f"MIN(CASE WHEN {column}<>-999 THEN {column} END), "
+                               f"MAX(CASE WHEN {column}<>-999 THEN {column} END), "
+                               f"SUM(CASE WHEN {column}<>-999 THEN {column} END)"
+                               for column in RollupService.__measurements)
+        return RollupService.__upsert("ReadingsHourly", "Readings", RollupService.__hour_start.format("timestamp"),
+                                      f"COUNT(*), {aggregates}", conditions)
+
+    @staticmethod
+    def __daily(conditions:str) -> str:
+        aggregates = ", ".join(f"SUM({column}_n), MIN({column}_min), MAX({column}_max), SUM({column}_sum)"
+                               for column in RollupService.__measurements)
+        return RollupService.__upsert("ReadingsDaily", "ReadingsHourly", "DATE(bucket)",
+                                      f"SUM(samples), {aggregates}", conditions)
+
+    @staticmethod
+    def refresh(cursor, points:List[Tuple[str, Any]]) -> None:
+        """
+        Recompute the hourly and daily buckets containing the given (MAC, timestamp) points.
+        Runs on the caller's cursor inside its transaction, so raw rows and rollups commit together.
+        Raises mysql.Error on failure.
+        """
+        hour = RollupService.__hour_start.format("%s")
+        hourly = RollupService.__hourly(f"MAC=%s AND timestamp>={hour} AND timestamp<{hour} + INTERVAL 1 HOUR")
+        daily = RollupService.__daily("MAC=%s AND bucket>=DATE(%s) AND bucket<DATE(%s) + INTERVAL 1 DAY")
+
+        # A batch usually spans a handful of buckets. Keys are only for deduplication, SQL does the truncation.
+        hours = {(MAC, str(timestamp)[:13]): (MAC, timestamp) for MAC, timestamp in points}
+        days = {(MAC, str(timestamp)[:10]): (MAC, timestamp) for MAC, timestamp in points}
+        for MAC, timestamp in hours.values():
+            cursor.execute(hourly, (MAC, timestamp, timestamp, timestamp, timestamp))
+        for MAC, timestamp in days.values():
+            cursor.execute(daily, (MAC, timestamp, timestamp))
+
+    @staticmethod
+    def rebuild(MAC:str | None = None, start:datetime | None = None, end:datetime | None = None) -> bool:
+        """
+        Recompute every bucket between start and end, for one device or all of them.
+        Without bounds the whole history in Readings is covered. Works through ROLLUP_REBUILD_DAYS
+        days per transaction so a large backfill doesn't hold one huge lock set.
+        """
+        device = " AND MAC=%s" if MAC else ""
+        conn = Manager.get_conn()
+        cursor = None
+        rebuilt = False
+        try:
+            cursor = conn.cursor(buffered=True)
+            if start is None or end is None:
+                cursor.execute(f"SELECT MIN(timestamp), MAX(timestamp) FROM Readings WHERE 1=1{device};", (MAC,) if MAC else ())
+                first, last = cursor.fetchone()
+                if first is None: return True
+                start = first if start is None else start
+                end = last + timedelta(seconds = 1) if end is None else end
+
+            # Windows start at midnight so every daily bucket is built from complete hours.
+            window = datetime(start.year, start.month, start.day)
+            hourly = RollupService.__hourly(f"timestamp>=%s AND timestamp<%s{device}")
+            daily = RollupService.__daily(f"bucket>=%s AND bucket<%s{device}")
+            while window < end:
+                following = window + timedelta(days = ROLLUP_REBUILD_DAYS)
+                params = (window, following, MAC) if MAC else (window, following)
+                cursor.execute(hourly, params)
+                cursor.execute(daily, params)
+                conn.commit()
+                window = following
+            rebuilt = True
+
+        except mysql.Error as e:
+            debug(f"Couldn't rebuild reading rollups -> {e}")
+            conn.rollback()
+
+        finally:
+            if cursor: cursor.close()
+
+        return rebuilt
+
+    @staticmethod
+    def catch_up() -> bool:
+        """
+        Rebuild from the last hourly bucket onward, covering readings written while
+        rollups weren't maintained. With no rollups yet, the whole history is built.
+        """
+        cursor = None
+        latest = None
+        try:
+            cursor = Manager.get_conn().cursor(buffered=True)
+            cursor.execute("SELECT MAX(bucket) FROM ReadingsHourly;")
+            latest = cursor.fetchone()[0]
+
+        except mysql.Error as e:
+            debug(f"Couldn't find latest reading rollup -> {e}")
+            return False
+
+        finally:
+            if cursor: cursor.close()
+
+        return RollupService.rebuild(start = latest)
+
+    @staticmethod
+    def get(MAC:str, start:datetime | None = None, end:datetime | None = None, resolution:str = "hour") -> List[RollupEntity]:
+        """
+        Buckets of one device with start <= bucket < end, oldest first.
+        resolution is "hour" or "day".
+        """
+        table = RollupService.__tables[resolution]
+        conditions = ["MAC=%s"]
+        params:List[Any] = [MAC]
+        for condition, value in (("bucket>=%s", start), ("bucket<%s", end)):
+            if value is None: continue
+            conditions.append(condition)
+            params.append(value)
+
+        query_string = f"SELECT * FROM {table} WHERE {' AND '.join(conditions)} ORDER BY bucket;"
+        rollups = []
         cursor = None
         try:
             cursor = Manager.get_conn().cursor(dictionary=True)
-            cursor.execute(query_string)
+            cursor.execute(query_string, tuple(params))
 
             for row in cursor.fetchall():
-                status = SensorEntity(
+                aggregates = []
+                for column in RollupService.__measurements:
+                    count, total = row[f"{column}_n"], row[f"{column}_sum"]
+                    aggregates.append(Aggregate(count, row[f"{column}_min"], row[f"{column}_max"],
+                                                total / count if count else None))
+                rollups.append(RollupEntity(row["MAC"], row["bucket"], row["samples"], *aggregates))
+
+        except mysql.Error as e:
+            debug(f"Couldn't fetch reading rollups -> {e}")
+
+        finally:
+            if cursor: cursor.close()
+
+        return rollups
+
+class StatusService(Service):
+    @staticmethod
+    def get_all() -> List[SensorEntity]:
+        try:
+            return list(StatusService.iter_all())
+        except mysql.Error:
+            return []
+
+    @staticmethod
+    def iter_all(batch_size:int = FETCH_CHUNK_ROWS) -> Generator[SensorEntity, None, None]:
+        """
+        Yield every device status, batch_size rows at a time.
+        """
+        for rows in _fetch_chunks("SELECT * FROM Status;", batch_size = batch_size, what = "sensor status records list"):
+            for row in rows:
+                yield SensorEntity(
                     row["MAC"],
                     row["timestamp"],
                     row["SHT"],
@@ -310,15 +843,6 @@ class StatusService(Service):
                     row["CAM"],
                     row["WIFI"]
                 )
-                statuses.append(status)
-
-        except mysql.Error as e:
-            debug(f"Couldn't fetch sensor status records list -> {e}")
-
-        finally:
-            if cursor: cursor.close()
-
-        return status
 
     @staticmethod
     def get(MAC:str) -> SensorEntity | None:
@@ -390,6 +914,63 @@ class StatusService(Service):
         finally:
             if cursor: cursor.close()
 
+    @staticmethod
+    def upsert(MAC:str, timestamp:str, sht:bool, bmp:bool, cam:bool, wifi:bool = True) -> bool:
+        """
+        Insert or update the status of a device in a single statement.
+        """
+        conn = Manager.get_conn()
+        upsert_string = "INSERT INTO Status (MAC, SHT, BMP, CAM, WIFI, timestamp) VALUES(%s, %s, %s, %s, %s, %s) " + \
+                        "ON DUPLICATE KEY UPDATE SHT=VALUES(SHT), BMP=VALUES(BMP), CAM=VALUES(CAM), " + \
+                        "WIFI=VALUES(WIFI), timestamp=VALUES(timestamp);"
+        cursor = None
+        stored = False
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                upsert_string, (MAC, sht, bmp, cam, wifi, timestamp)
+            )
+            conn.commit()
+            stored = True
+
+        except mysql.Error as e:
+            debug(f"Couldn't upsert sensor status record -> {e}")
+
+        finally:
+            if cursor: cursor.close()
+
+        return stored
+
+    @staticmethod
+    def upsert_many(statuses:List[SensorEntity], commit:bool = True) -> bool:
+        """
+        Insert or update the status of many devices with a single multi-row statement.
+        Pass commit=False to leave the transaction open for the caller.
+        """
+        if not statuses: return True
+        conn = Manager.get_conn()
+        upsert_string = "INSERT INTO Status (MAC, SHT, BMP, CAM, WIFI, timestamp) VALUES(%s, %s, %s, %s, %s, %s) " + \
+                        "ON DUPLICATE KEY UPDATE SHT=VALUES(SHT), BMP=VALUES(BMP), CAM=VALUES(CAM), " + \
+                        "WIFI=VALUES(WIFI), timestamp=VALUES(timestamp);"
+        values = [(status.get_mac(), status.get_sht(), status.get_bmp(), status.get_cam(),
+                   True if status.get_wifi() is None else status.get_wifi(), status.get_timestamp()) for status in statuses]
+        cursor = None
+        stored = False
+        try:
+            cursor = conn.cursor()
+            cursor.executemany(upsert_string, values)
+            if commit: conn.commit()
+            stored = True
+
+        except mysql.Error as e:
+            debug(f"Couldn't upsert sensor status batch -> {e}")
+            conn.rollback()
+
+        finally:
+            if cursor: cursor.close()
+
+        return stored
+
     @staticmethod
     def exists(MAC:str) -> bool:
         query_string = "SELECT * FROM Status WHERE MAC=%s LIMIT 1;"
@@ -413,6 +994,67 @@ class StatusService(Service):
         return stats
 
 
+class ArtifactService(Service):
+    @staticmethod
+    def get(MAC:str, timestamp:str) -> ArtifactEntity | None:
+        query_string = "SELECT * FROM ImageArtifacts WHERE MAC=%s AND timestamp=%s LIMIT 1;"
+        artifact = None
+        cursor = None
+        try:
+            cursor = Manager.get_conn().cursor(dictionary=True)
+            cursor.execute(query_string, (MAC, timestamp))
+
+            row = cursor.fetchone()
+            if row:
+                artifact = ArtifactEntity(
+                    row["MAC"],
+                    row["timestamp"],
+                    row["undistorted_path"],
+                    row["cloud_path"],
+                    row["sky_path"],
+                    row["cloud_fraction"]
+                )
+
+        except mysql.Error as e:
+            debug(f"Couldn't fetch image artifact record -> {e}")
+
+        finally:
+            if cursor: cursor.close()
+
+        return artifact
+
+    @staticmethod
+    def upsert(MAC:str, timestamp:str, undistorted_path:str, cloud_path:str, sky_path:str, cloud_fraction:float) -> bool:
+        """
+        Record the artifacts derived from the image of a reading, replacing any earlier ones.
+        """
+        conn = Manager.get_conn()
+        upsert_string = "INSERT INTO ImageArtifacts (timestamp, MAC, undistorted_path, cloud_path, sky_path, cloud_fraction) " + \
+                        "VALUES(%s, %s, %s, %s, %s, %s) ON DUPLICATE KEY UPDATE undistorted_path=VALUES(undistorted_path), " + \
+                        "cloud_path=VALUES(cloud_path), sky_path=VALUES(sky_path), cloud_fraction=VALUES(cloud_fraction);"
+        cursor = None
+        stored = False
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                upsert_string, (timestamp, MAC, undistorted_path, cloud_path, sky_path, cloud_fraction)
+            )
+            conn.commit()
+            stored = True
+
+        except mysql.Error as e:
+            debug(f"Couldn't upsert image artifact record -> {e}")
+
+        finally:
+            if cursor: cursor.close()
+
+        return stored
+
+    @staticmethod
+    def exists(MAC:str, timestamp:str) -> bool:
+        return ArtifactService.get(MAC, timestamp) is not None
+
+
 class LocationService(Service):
     @staticmethod
     def country_exists(region:str) -> bool:
@@ -514,33 +1156,25 @@ class LocationService(Service):
 
     @staticmethod
     def get_all() -> List[LocationEntity]:
-        query_string = "SELECT * FROM Locations;"
-        locs = []
-        cursor = None
         try:
-            cursor = Manager.get_conn().cursor(dictionary=True)
-            if not cursor:
-                debug("No database connection.")
-                return []
-            cursor.execute(query_string)
+            return list(LocationService.iter_all())
+        except mysql.Error:
+            return []
 
-            for row in cursor.fetchall():
-                location = LocationEntity(
+    @staticmethod
+    def iter_all(batch_size:int = FETCH_CHUNK_ROWS) -> Generator[LocationEntity, None, None]:
+        """
+        Yield every location, batch_size rows at a time.
+        """
+        for rows in _fetch_chunks("SELECT * FROM Locations;", batch_size = batch_size, what = "location records list"):
+            for row in rows:
+                yield LocationEntity(
                     row["country"],
                     row["region"],
                     row["city"],
                     row["latitude"],
                     row["longitude"]
                 )
-                locs.append(location)
-
-        except mysql.Error as e:
-            debug(f"Couldn't fetch location records list -> {e}")
-
-        finally:
-            if cursor: cursor.close()
-
-        return locs
 
     def get(latitude:float, longitude:float) -> LocationEntity:
         query_string = "SELECT * FROM Locations WHERE latitude=%s AND longitude=%s LIMIT 1;"
@@ -670,34 +1304,25 @@ class LocationService(Service):
 class UserService(Service):
     @staticmethod
     def get_all() -> List[UserEntity]:
-        query_string = "SELECT * FROM Users;"
-        users = []
-        cursor = None
-
         try:
-            cursor = Manager.get_conn().cursor(dictionary=True)
-            if not cursor:
-                debug("No database connection.")
-                return None
-            cursor.execute(query_string)
+            return list(UserService.iter_all())
+        except mysql.Error:
+            return []
 
-            for row in cursor.fetchall():
-                user = UserEntity(
+    @staticmethod
+    def iter_all(batch_size:int = FETCH_CHUNK_ROWS) -> Generator[UserEntity, None, None]:
+        """
+        Yield every user, batch_size rows at a time.
+        """
+        for rows in _fetch_chunks("SELECT * FROM Users;", batch_size = batch_size, what = "users record"):
+            for row in rows:
+                yield UserEntity(
                     id = row["ID"],
                     name = row["name"],
                     email = row["email"],
                     password = row['password'],
                     role = Role.match(row["role"])
                 )
-                users.append(user)
-
-        except mysql.Error as e:
-            debug(f"Couldn't fetch users record -> {e}")
-
-        finally:
-            if cursor: cursor.close()
-
-        return users
 
 
     @staticmethod
@@ -0,0 +1,135 @@
+from src.config import *
+from threading import Lock, local
+from time import perf_counter
+
+class QueryStats:
+    """
+    Static process-wide counters of executed statements and the slow-query log.
+    Each thread also keeps its own running count, which the request metrics reset and read
+    around every request.
+    """
+    __local:local = local()
+    __lock:Lock = Lock()
+    __queries:int = 0
+    __seconds:float = 0.0
+    __slow:int = 0
+
+    @staticmethod
+    def record(operation:str, params:Any, seconds:float, rows:int) -> None:
+        """
+        Account for one finished statement, against the calling thread too,
+        and log it if it ran for longer than SLOW_QUERY_MS.
+        """
+        slow = seconds * 1000 >= SLOW_QUERY_MS
+        with QueryStats.__lock:
+            QueryStats.__queries += 1
+            QueryStats.__seconds += seconds
+            if slow: QueryStats.__slow += 1
+
+        QueryStats.__local.queries = getattr(QueryStats.__local, "queries", 0) + 1
+        QueryStats.__local.seconds = getattr(QueryStats.__local, "seconds", 0.0) + seconds
+
+        if slow:
+            sql = " ".join(str(operation).split())
+            debug(f"Slow query ({seconds * 1000:.1f} ms, {rows} rows): {sql[:SLOW_QUERY_LOG_CHARS]} "
+                  f"-- params: {repr(params)[:SLOW_QUERY_LOG_CHARS]}")
+
+    @staticmethod
+    def take() -> Tuple[int, float]:
+        """
+        Statements run and seconds spent by the calling thread since its last take(), then reset both.
+        """
+        queries = getattr(QueryStats.__local, "queries", 0)
+        seconds = getattr(QueryStats.__local, "seconds", 0.0)
+        QueryStats.__local.queries, QueryStats.__local.seconds = 0, 0.0
+        return queries, seconds
+
+    @staticmethod
+    def stats() -> Dict[str, int | float]:
+        return {"queries": QueryStats.__queries,
+                "seconds": QueryStats.__seconds,
+                "slow": QueryStats.__slow}
+
+
+class TimedCursor:
+    """
+    Cursor wrapper timing each statement from execute until its results are read,
+    counting the rows it returned or affected.
+    """
+    __slots__ = ("_cursor", "_operation", "_params", "_seconds", "_rows")
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._operation = None
+        self._params = None
+        self._seconds = 0.0
+        self._rows = 0
+
+    def execute(self, operation:str, params:Any = None, *args, **kwargs) -> Any:
+        self.__finish()
+        self._operation, self._params = operation, params
+        return self.__timed(self._cursor.execute, operation, params, *args, **kwargs)
+
+    def executemany(self, operation:str, seq_params:Any, *args, **kwargs) -> Any:
+        self.__finish()
+        self._operation, self._params = operation, seq_params
+        result = self.__timed(self._cursor.executemany, operation, seq_params, *args, **kwargs)
+        self._rows = max(self._cursor.rowcount, 0)
+        return result
+
+    def fetchone(self) -> Any:
+        row = self.__timed(self._cursor.fetchone)
+        if row is not None: self._rows += 1
+        return row
+
+    def fetchmany(self, size:int = 1) -> List[Any]:
+        rows = self.__timed(self._cursor.fetchmany, size)
+        self._rows += len(rows)
+        return rows
+
+    def fetchall(self) -> List[Any]:
+        rows = self.__timed(self._cursor.fetchall)
+        self._rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def close(self) -> Any:
+        self.__finish()
+        return self._cursor.close()
+
+    def __getattr__(self, name:str) -> Any:
+        return getattr(self._cursor, name)
+
+    def __timed(self, method, *args, **kwargs) -> Any:
+        start = perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            self._seconds += perf_counter() - start
+
+    def __finish(self) -> None:
+        """
+        Record the previous statement, if any.
+        """
+        if self._operation is None: return
+        rows = self._rows if self._rows else max(self._cursor.rowcount or 0, 0)
+        QueryStats.record(self._operation, self._params, self._seconds, rows)
+        self._operation, self._params, self._seconds, self._rows = None, None, 0.0, 0
+
+
+class TimedConnection:
+    """
+    Connection wrapper whose cursors are timed.
+    """
+    __slots__ = ("_conn",)
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, *args, **kwargs) -> TimedCursor:
+        return TimedCursor(self._conn.cursor(*args, **kwargs))
+
+    def __getattr__(self, name:str) -> Any:
+        return getattr(self._conn, name)
@@ -0,0 +1,41 @@
+"""
+Explicit schema migration of an existing database.
+
+    python -m src.db.migrate
+    python -m src.db.migrate --partition-readings
+
+Applies the idempotent schema, adding the tables and columns introduced since the
+database was created, instead of doing it on every server startup.
+With --partition-readings it also converts the Readings table to monthly partitions,
+which rewrites the table and drops its foreign key to Devices.
+"""
+
+from src.db.Management import Manager
+from src.db.schema import partition_readings
+from src.config import debug
+import mysql.connector as mysql
+import sys
+
+
+def main(argv:list) -> int:
+    try:
+        Manager.connect(migrate = True)
+    except RuntimeError as e:
+        debug(e)
+        return 1
+    debug("Schema migrated.")
+
+    if "--partition-readings" in argv:
+        try:
+            if partition_readings(Manager.get_conn()): debug("Readings partitioned by month.")
+            else: debug("Readings already partitioned.")
+        except mysql.Error as e:
+            debug(f"Couldn't partition Readings -> {e}")
+            return 1
+        finally:
+            Manager.release()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,8 +1,182 @@
 import mysql.connector as mysql
-from src.config import debug
+from src.config import *
 
 
 
+def __column_length(mydb:mysql.MySQLConnection, table:str, column:str) -> int:
+    """
+    Return the declared character length of a column in the weather database.
+    """
+    cursor = mydb.cursor(buffered=True)
+    cursor.execute("""
+        SELECT CHARACTER_MAXIMUM_LENGTH FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA='weather' AND TABLE_NAME=%s AND COLUMN_NAME=%s;
+    """, (table, column))
+    row = cursor.fetchone()
+    cursor.close()
+    return row[0] if row and row[0] is not None else 0
+
+
+def __ensure_column(mydb:mysql.MySQLConnection, table:str, column:str, definition:str) -> bool:
+    """
+    Add a column to a table in the weather database if it doesn't have it yet.
+    Return True if the column was added.
+    """
+    cursor = mydb.cursor(buffered=True)
+    cursor.execute("""
+        SELECT 1 FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA='weather' AND TABLE_NAME=%s AND COLUMN_NAME=%s LIMIT 1;
+    """, (table, column))
+    missing = cursor.fetchone() is None
+    if missing: cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition};")
+    cursor.close()
+    return missing
+
+
+def __month_start(moment:datetime, offset:int = 0) -> datetime:
+    """
+    Midnight on the first of the month offset months from the one moment falls in.
+    """
+    months = moment.year * 12 + moment.month - 1 + offset
+    return datetime(months // 12, months % 12 + 1, 1)
+
+
+def __month_partitions(first:datetime, last:datetime) -> List[str]:
+    """
+    Definitions of one partition per month from first up to, but not including, last.
+    """
+    definitions = []
+    month = __month_start(first)
+    while month < last:
+        following = __month_start(month, 1)
+        definitions.append(f"PARTITION p{month:%Y%m} VALUES LESS THAN ('{following:%Y-%m-%d}')")
+        month = following
+    return definitions
+
+
+def __partition_clause(first:datetime) -> str:
+    """
+    Monthly RANGE partitioning of Readings starting at the month of first.
+    Older rows go to pold and rows past the last month to pmax, so no insert ever lacks a partition.
+    """
+    first = __month_start(first)
+    definitions = [f"PARTITION pold VALUES LESS THAN ('{first:%Y-%m-%d}')"]
+    definitions += __month_partitions(first, __month_start(datetime.now(), 1))
+    definitions.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+    return f"PARTITION BY RANGE COLUMNS(timestamp) ({', '.join(definitions)})"
+
+
+def __partitions(mydb:mysql.MySQLConnection, table:str) -> List[Tuple[str, datetime | None]]:
+    """
+    Partitions of a table in the weather database with their upper bound, None for MAXVALUE.
+    Empty if the table isn't partitioned.
+    """
+    cursor = mydb.cursor(buffered=True)
+    cursor.execute("""
+        SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA='weather' AND TABLE_NAME=%s AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION;
+    """, (table,))
+    rows = cursor.fetchall()
+    cursor.close()
+
+    partitions = []
+    for name, description in rows:
+        bound = None if description == "MAXVALUE" else datetime.fromisoformat(description.strip("'"))
+        partitions.append((name, bound))
+    return partitions
+
+
+def __foreign_keys(mydb:mysql.MySQLConnection, table:str) -> List[str]:
+    """
+    Names of the foreign keys declared on a table in the weather database.
+    """
+    cursor = mydb.cursor(buffered=True)
+    cursor.execute("""
+        SELECT CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS
+        WHERE CONSTRAINT_SCHEMA='weather' AND TABLE_NAME=%s;
+    """, (table,))
+    names = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    return names
+
+
+def partition_readings(mydb:mysql.MySQLConnection) -> bool:
+    """
+    Convert an existing unpartitioned Readings table to monthly partitions, starting at its oldest reading.
+    Partitioned tables can't hold foreign keys, so the reference to Devices is dropped;
+    readings are only stored for devices the handlers already know.
+    Rewrites the table once, which takes a while on a large one, so it is only run as an explicit migration.
+    Return False if the table was already partitioned.
+    """
+    if __partitions(mydb, "Readings"): return False
+
+    cursor = mydb.cursor(buffered=True)
+    cursor.execute("SELECT MIN(timestamp) FROM Readings;")
+    first = cursor.fetchone()[0] or datetime.now()
+
+    # Either step may already be done if an earlier migration was interrupted.
+    alterations = [f"DROP FOREIGN KEY {name}" for name in __foreign_keys(mydb, "Readings")]
+    cursor.execute("""
+        SELECT 1 FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA='weather' AND TABLE_NAME='Readings' AND INDEX_NAME='readings_timestamp' LIMIT 1;
+    """)
+    if cursor.fetchone() is None: alterations.append("ADD INDEX readings_timestamp (timestamp)")
+
+    debug("Partitioning the Readings table by month. This rewrites the table.")
+    if alterations: cursor.execute(f"ALTER TABLE Readings {', '.join(alterations)};")
+    cursor.execute(f"ALTER TABLE Readings {__partition_clause(first)};")
+    cursor.close()
+    maintain_partitions(mydb)
+    return True
+
+
+def ensure_partitions(mydb:mysql.MySQLConnection, months_ahead:int = PARTITION_MONTHS_AHEAD) -> List[str]:
+    """
+    Create the Readings partitions for the coming months ahead of time, by splitting them off pmax.
+    pmax only holds rows from beyond the last month, normally none, so this is cheap.
+    Return the names of the partitions created.
+    """
+    bounds = [bound for _, bound in __partitions(mydb, "Readings") if bound is not None]
+    if not bounds: return []
+
+    definitions = __month_partitions(max(bounds), __month_start(datetime.now(), months_ahead + 1))
+    if not definitions: return []
+
+    definitions.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+    cursor = mydb.cursor()
+    cursor.execute(f"ALTER TABLE Readings REORGANIZE PARTITION pmax INTO ({', '.join(definitions)});")
+    cursor.close()
+    return [definition.split()[1] for definition in definitions[:-1]]
+
+
+def drop_partitions(mydb:mysql.MySQLConnection, before:datetime) -> List[str]:
+    """
+    Delete every reading older than before by dropping the whole monthly partitions that end by then.
+    Readings in the month containing before are kept. The hourly and daily rollups are untouched.
+    Return the names of the partitions dropped.
+    """
+    expired = [name for name, bound in __partitions(mydb, "Readings") if bound is not None and bound <= before]
+    if not expired: return []
+
+    cursor = mydb.cursor()
+    cursor.execute(f"ALTER TABLE Readings DROP PARTITION {', '.join(expired)};")
+    cursor.close()
+    debug(f"Dropped expired reading partitions: {', '.join(expired)}")
+    return expired
+
+
+def maintain_partitions(mydb:mysql.MySQLConnection) -> None:
+    """
+    Create upcoming Readings partitions and apply the retention period, if partitioned.
+    Run on a schedule by PartitionMaintenance.
+    """
+    if not __partitions(mydb, "Readings"): return
+    ensure_partitions(mydb)
+    if READINGS_RETENTION_MONTHS is not None:
+        drop_partitions(mydb, __month_start(datetime.now(), -READINGS_RETENTION_MONTHS))
+
+
 def apply(mydb:mysql.MySQLConnection):
     myCursor = mydb.cursor()
     # Create the cook book database 
@@ -24,8 +198,14 @@ def apply(mydb:mysql.MySQLConnection):
         );
     """)
 
-    # Create readings table
-    myCursor.execute("""
+    # Create readings table, partitioned by month if configured. An existing table is left as it is.
+    if PARTITION_READINGS:
+        layout = "INDEX readings_timestamp (timestamp)"
+        partitioning = __partition_clause(datetime.now())
+    else:
+        layout = "FOREIGN KEY (MAC) REFERENCES Devices(MAC)"
+        partitioning = ""
+    myCursor.execute(f"""
     CREATE TABLE IF NOT EXISTS Readings(
         timestamp DATETIME,
         MAC VARCHAR(25),
@@ -33,12 +213,20 @@ def apply(mydb:mysql.MySQLConnection):
         relative_humidity FLOAT(10),
         pressure FLOAT(10),
         dewpoint FLOAT(10),
-        filepath VARCHAR(100),
+        filepath VARCHAR(255),
+        lcl_m FLOAT(10),
         PRIMARY KEY (MAC, timestamp),
-        FOREIGN KEY (MAC) REFERENCES Devices(MAC)
-    );
+        {layout}
+    ) {partitioning};
 """)
                     
+    # Image store paths outgrew the original column width.
+    if __column_length(mydb, "Readings", "filepath") < 255:
+        myCursor.execute("ALTER TABLE Readings MODIFY filepath VARCHAR(255);")
+
+    # Lifting condensation level in metres above sea level, stored at ingest and backfilled.
+    __ensure_column(mydb, "Readings", "lcl_m", "FLOAT(10)")
+
     # Create status table
     myCursor.execute("""
         CREATE TABLE IF NOT EXISTS Status(
@@ -52,6 +240,37 @@ def apply(mydb:mysql.MySQLConnection):
         );
     """)
 
+    # Create table of artifacts derived from uploaded images
+    myCursor.execute("""
+        CREATE TABLE IF NOT EXISTS ImageArtifacts(
+            timestamp DATETIME,
+            MAC VARCHAR(25),
+            undistorted_path VARCHAR(255),
+            cloud_path VARCHAR(255),
+            sky_path VARCHAR(255),
+            cloud_fraction FLOAT(10),
+            PRIMARY KEY (MAC, timestamp),
+            FOREIGN KEY (MAC) REFERENCES Devices(MAC)
+        );
+    """)
+
+    # Create hourly and daily reading rollups. Per measurement: how many valid samples,
+    # their min, max and sum, so merged buckets still give an exact mean.
+    measurements = ", ".join(f"{column}_n INT NOT NULL DEFAULT 0, {column}_min FLOAT(10), "
+                             f"{column}_max FLOAT(10), {column}_sum DOUBLE"
+                             for column in ("temperature", "relative_humidity", "pressure", "dewpoint"))
+    for table in ("ReadingsHourly", "ReadingsDaily"):
+        myCursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table}(
+                bucket DATETIME,
+                MAC VARCHAR(25),
+                samples INT NOT NULL,
+                {measurements},
+                PRIMARY KEY (MAC, bucket),
+                FOREIGN KEY (MAC) REFERENCES Devices(MAC)
+            );
+        """)
+
     myCursor.execute("""
         CREATE TABLE IF NOT EXISTS Locations(
             country VARCHAR(30),
@@ -76,3 +295,5 @@ def apply(mydb:mysql.MySQLConnection):
 
     # Commit
     mydb.commit()
+
+    maintain_partitions(mydb)
@@ -0,0 +1,117 @@
+from src.config import *
+from src.db.Services import ReadingService
+from src.db.Frame import ReadingFrame
+from numpy.lib.format import open_memmap, write_array
+from tempfile import TemporaryDirectory
+from zipfile import ZipFile, ZIP_STORED
+from io import StringIO
+import csv
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+
+class ReadingExport:
+    """
+    Static columnar export of the Readings table for a device and time range.
+    Rows are read with fetchmany EXPORT_CHUNK_ROWS at a time and converted a chunk at a time,
+    so memory stays bounded however many rows are exported.
+    Values are exported as stored, unreadable measurements included as -999.
+    A missing LCL is exported empty, or as NaN in the .npz, and one that couldn't be computed as -999.
+    """
+    # Columns of the .npz export. Image paths are left out: a fixed-width string column
+    # would dwarf the measurements on disk, CSV and Parquet carry them.
+    __npz_dtypes:Dict[str, str] = {
+        "timestamp": "datetime64[s]",
+        "MAC": "U25",
+        "temperature": "f8",
+        "relative_humidity": "f8",
+        "pressure": "f8",
+        "dewpoint": "f8",
+        "lcl_m": "f8"
+    }
+
+    @staticmethod
+    def parquet_available() -> bool:
+        return pq is not None
+
+    @staticmethod
+    def csv(MAC:str | None = None, start:datetime | None = None, end:datetime | None = None,
+            chunk_size:int = EXPORT_CHUNK_ROWS) -> Generator[str, None, None]:
+        """
+        Yield the readings as CSV text, one block per chunk, header first.
+        """
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(ReadingService.COLUMNS)
+        yield buffer.getvalue()
+
+        for rows in ReadingService.iter_chunks(MAC, start, end, chunk_size = chunk_size):
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(rows)
+            yield buffer.getvalue()
+
+    @staticmethod
+    def npz(path:str, MAC:str | None = None, start:datetime | None = None, end:datetime | None = None,
+            chunk_size:int = EXPORT_CHUNK_ROWS) -> int:
+        """
+        Write the readings to an uncompressed .npz with one array per column, loadable with numpy.load.
+        Columns are filled chunk by chunk through memory-mapped scratch files sized by a COUNT,
+        then copied into the archive. Return the number of rows written.
+        """
+        total = ReadingService.count(MAC, start, end)
+        dtypes = ReadingExport.__npz_dtypes
+        with TemporaryDirectory() as scratch:
+            if total:
+                arrays = {name: open_memmap(f"{scratch}/{name}.npy", mode = "w+", dtype = dtype, shape = (total,))
+                          for name, dtype in dtypes.items()}
+            else:
+                arrays = {name: np.empty(0, dtype = dtype) for name, dtype in dtypes.items()}
+
+            # Rows written after the COUNT are left for the next export.
+            written = 0
+            for rows in ReadingService.iter_chunks(MAC, start, end, limit = total, chunk_size = chunk_size):
+                columns = dict(zip(ReadingService.COLUMNS, zip(*rows)))
+                columns["timestamp"] = ReadingFrame.datetime64(columns["timestamp"])
+                for name, array in arrays.items():
+                    array[written:written + len(rows)] = columns[name]
+                written += len(rows)
+
+            with ZipFile(path, "w", ZIP_STORED, allowZip64 = True) as archive:
+                for name, array in arrays.items():
+                    with archive.open(f"{name}.npy", "w", force_zip64 = True) as member:
+                        write_array(member, array[:written], allow_pickle = False)
+
+            del arrays
+
+        return written
+
+    @staticmethod
+    def parquet(path:str, MAC:str | None = None, start:datetime | None = None, end:datetime | None = None,
+                chunk_size:int = EXPORT_CHUNK_ROWS) -> int:
+        """
+        Write the readings to a Parquet file, one row group per chunk. Needs pyarrow.
+        Return the number of rows written.
+        """
+        if pq is None: raise RuntimeError("Parquet export needs pyarrow installed.")
+
+        schema = pa.schema([("timestamp", pa.timestamp("s")),
+                            ("MAC", pa.string()),
+                            ("temperature", pa.float64()),
+                            ("relative_humidity", pa.float64()),
+                            ("pressure", pa.float64()),
+                            ("dewpoint", pa.float64()),
+                            ("filepath", pa.string()),
+                            ("lcl_m", pa.float64())])
+        written = 0
+        with pq.ParquetWriter(path, schema) as writer:
+            for rows in ReadingService.iter_chunks(MAC, start, end, chunk_size = chunk_size):
+                columns = [pa.array(column, type = field.type) for column, field in zip(zip(*rows), schema)]
+                writer.write_table(pa.Table.from_arrays(columns, schema = schema))
+                written += len(rows)
+
+        return written
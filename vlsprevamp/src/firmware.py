@@ -0,0 +1,190 @@
+from src.config import *
+from threading import Lock
+from time import monotonic
+import hashlib
+import gzip
+import zlib
+
+class Release(NamedTuple):
+    """
+    The firmware currently offered to devices, as described by the firmware manifest.
+    """
+    version:str
+    path:str
+    sha256:str
+    size:int
+    mtime:float
+    variants:Dict[str, str]     # Content-Encoding -> path of the precompressed binary
+
+
+class Firmware:
+    """
+    Static cache of the firmware manifest and the metadata of its binary.
+    The manifest is parsed once and only re-read when its mtime changes, and the
+    binary is hashed once per release. The mtimes are checked at most every
+    FIRMWARE_CHECK_SECONDS, so most OTA checks never touch the disk.
+    """
+    __release:Release | None = None
+    __manifest_mtime:float | None = None
+    __checked_at:float | None = None
+    __lock:Lock = Lock()
+
+    @staticmethod
+    def current() -> Release | None:
+        """
+        Return the current release, refreshing it if the manifest or binary changed.
+        """
+        checked_at = Firmware.__checked_at
+        if checked_at is not None and (monotonic() - checked_at) < FIRMWARE_CHECK_SECONDS:
+            return Firmware.__release
+
+        with Firmware.__lock:
+            Firmware.__refresh()
+            Firmware.__checked_at = monotonic()
+        return Firmware.__release
+
+    @staticmethod
+    def __refresh() -> None:
+        """
+        Reload the manifest if its mtime moved, and rehash the binary if it changed.
+        """
+        try:
+            manifest_mtime = os.path.getmtime(FIRMWARE_CONF)
+        except OSError:
+            Firmware.__release = None
+            Firmware.__manifest_mtime = None
+            return
+
+        release = Firmware.__release
+        if manifest_mtime == Firmware.__manifest_mtime and release is not None:
+            try:
+                if os.path.getmtime(release.path) == release.mtime: return
+            except OSError:
+                Firmware.__release = None
+                return
+
+        conf_dict = load_toml(FIRMWARE_CONF)
+        Firmware.__manifest_mtime = manifest_mtime
+        if not conf_dict or not conf_dict.get('path') or not conf_dict.get('version'):
+            Firmware.__release = None
+            return
+
+        path = f"{ROOT}/{conf_dict['path']}"
+        if not os.path.exists(path):
+            debug(f"Firmware binary {path} not found.")
+            Firmware.__release = None
+            return
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(UPLOAD_CHUNK_BYTES), b""):
+                digest.update(chunk)
+
+        sha256 = digest.hexdigest()
+        Firmware.__release = Release(str(conf_dict['version']), path, sha256, os.path.getsize(path),
+                                     os.path.getmtime(path), Firmware.__compress(path, sha256))
+        debug(f"Loaded firmware {Firmware.__release.version} ({Firmware.__release.sha256}).")
+
+    @staticmethod
+    def __compress(path:str, sha256:str) -> Dict[str, str]:
+        """
+        Build the compressed variants of a binary once and cache them by content hash.
+        gzip suits HTTP clients; deflate is a raw zlib stream the ESP32 ROM inflater can decode.
+        """
+        variants = {}
+        with open(path, "rb") as f:
+            data = f.read()
+
+        for encoding, compress in (("gzip", lambda raw: gzip.compress(raw, 9, mtime = 0)),
+                                   ("deflate", lambda raw: zlib.compress(raw, 9))):
+            variant_path = os.path.join(FIRMWARE_CACHE, f"{sha256}.{encoding}")
+            if not os.path.exists(variant_path):
+                tmp_path = f"{variant_path}.part"
+                with open(tmp_path, "wb") as f:
+                    f.write(compress(data))
+                os.replace(tmp_path, variant_path)
+
+            # Only worth serving if it actually saves bytes on the wire.
+            if os.path.getsize(variant_path) < len(data):
+                variants[encoding] = variant_path
+
+        Firmware.__prune(sha256)
+        return variants
+
+    @staticmethod
+    def __prune(sha256:str) -> None:
+        """
+        Remove the cached variants of every binary other than the current one.
+        """
+        for name in os.listdir(FIRMWARE_CACHE):
+            if name.startswith(f"{sha256}."): continue
+            if not name.endswith((".gzip", ".deflate", ".part")): continue
+            try:
+                os.remove(os.path.join(FIRMWARE_CACHE, name))
+            except OSError as e:
+                debug(f"Couldn't remove cached firmware variant {name} -> {e}")
+
+
+def parse_accept_encoding(accept_encoding:str) -> Dict[str, float]:
+    """
+    Map each coding in an Accept-Encoding header to its q-value, 1 if none is given.
+    Items with a malformed or out of range q-value are ignored.
+    """
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        if not coding: continue
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() != "q": continue
+            try:
+                quality = float(value.strip())
+            except ValueError:
+                quality = -1.0
+        if 0 <= quality <= 1: qualities[coding.lower()] = quality
+    return qualities
+
+
+def choose_encoding(release:Release, device_encoding:str | None, accept_encoding:str | None) -> str | None:
+    """
+    Pick the precompressed variant to serve. A device header naming an encoding wins,
+    otherwise the variant with the highest non-zero q-value in Accept-Encoding, the first listed on a tie.
+    Codings not listed take the q-value of "*", if given.
+    Return None to serve the raw binary, including when identity is listed above every variant.
+    """
+    if device_encoding:
+        encoding = device_encoding.strip().lower()
+        return encoding if encoding in release.variants else None
+
+    if not accept_encoding: return None
+    qualities = parse_accept_encoding(accept_encoding)
+    wildcard = qualities.get("*", 0.0)
+    order = list(qualities)
+
+    best, best_quality = None, 0.0
+    for encoding in sorted(release.variants, key = lambda name: order.index(name) if name in order else len(order)):
+        quality = qualities.get(encoding, wildcard)
+        if quality > best_quality: best, best_quality = encoding, quality
+
+    if qualities.get("identity", 0.0) > best_quality: return None
+    return best
+
+
+def newer(outgoing:str, incoming:str) -> bool:
+    """
+    Return True if the dotted version outgoing is greater than incoming.
+    Missing components count as 0 and non-numeric components are compared as text.
+    """
+    def parts(version:str) -> List[int | str]:
+        return [int(part) if part.isdigit() else part for part in version.strip().split(".")]
+
+    out, inc = parts(outgoing), parts(incoming)
+    width = max(len(out), len(inc))
+    out += [0] * (width - len(out))
+    inc += [0] * (width - len(inc))
+    for o, i in zip(out, inc):
+        if o == i: continue
+        if isinstance(o, int) and isinstance(i, int): return o > i
+        return str(o) > str(i)
+    return False
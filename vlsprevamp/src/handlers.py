@@ -1,7 +1,15 @@
-from flask import Blueprint, Request, request, Response, render_template, make_response, send_file,jsonify, flash
+from flask import Blueprint, Request, request, Response, render_template, make_response, send_file,jsonify, flash, stream_with_context
 from src.config import *
 from src.db.Services import *
+from src.db.Ingest import IngestQueue
+from src.analysis.pipeline import ImagePipeline
+from src.analysis.cloudbase import attach_lcl
 from werkzeug.datastructures import Headers
+from src.store import ImageStore
+from src.firmware import Firmware, newer, choose_encoding
+from src.limits import RateLimiter
+from math import ceil, isfinite
+import json
 
 class HEADERS(Enum):
     """
@@ -15,6 +23,7 @@ class HEADERS(Enum):
     ESP_MAC = 'X-esp32-sta-mac'
     ESP_VERSION = 'X-esp32-version'
     ESP_SHA256 = 'X-esp32-sketch-sha256'
+    ESP_ENCODING = 'X-esp32-accept-encoding'
 
 
 def mac_filter(mac:str) -> bool:
@@ -23,46 +32,74 @@ def mac_filter(mac:str) -> bool:
     """
     return not DeviceService.exists(mac)
 
-def pad_array(padding:int, arr:List[str]):
+def need_update(board_version:str) -> bool:
     """
-    Pad an array of integers with 0s.
+    Return True if the firmware version needs to be updated.
     """
-    new_arr = ["0"]*padding
-    for item in arr: new_arr.append(item)
+    release = Firmware.current()
+    if release is None or board_version is None:
+        return False
+    booolean = newer(release.version, board_version)
+    if booolean: debug("Update needed!")
+    return booolean
 
-def load_config() -> Dict[str, str]:
+def parse_readings(values:List[str | float | None]) -> List[float]:
     """
-    Attempt to load the database config file.
+    Convert raw reading values to floats, using -999.00 for anything unparseable or not finite.
     """
-    return load_toml(FIRMWARE_CONF)
+    parsed = []
+    for value in values:
+        try:
+            value = float(value)
+            parsed.append(value if isfinite(value) else -999.00)
+        except Exception:
+            parsed.append(-999.00)
+    return parsed
 
-def need_update(board_version:str) -> bool:
+def valid_timestamp(value:str | None) -> bool:
     """
-    Return True if the firmware version needs to be updated.
+    Check a device timestamp parses as a date and time, "2024-05-01 12:00:00" or "2024-05-01T12:00:00",
+    so a malformed one is refused by the handler instead of failing a batched write later.
     """
-    conf_dict = load_config()
-    firmware_version = conf_dict['version'] 
-    firmware_version = firmware_version.split(".")
-    board_version = board_version.split(".")
-    if (firmware_version is None) or (board_version is None):
-        debug("NONETYPE HERE")
-    booolean = __greater(firmware_version, board_version)
-    if booolean: debug("Update needed!")
-    return booolean
-
+    if not value: return False
+    try:
+        datetime.fromisoformat(value)
+        return True
+    except (TypeError, ValueError):
+        return False
 
-def __greater(outgoing:List[str], incoming:List[str]) -> bool:
+def parse_timestamp(value:str | None) -> datetime | None:
     """
-    Compare one array of integers to another.
+    Parse an ISO 8601 query timestamp, "2024-05-01", "2024-05-01 12:00:00" or "2024-05-01T12:00:00".
+    Raise ValueError if it is malformed.
     """
-    diff:int = len(incoming) - len(outgoing)
-    if diff > 0: outgoing = pad_array(diff, outgoing)
-    elif diff < 0: incoming = pad_array(0-diff, incoming)
+    if value is None or value == "": return None
+    return datetime.fromisoformat(value)
 
-    for i in range(len(outgoing)):
-        if outgoing[i] > incoming[i]: return True
+def reading_to_dict(reading:ReadingEntity) -> Dict[str, Any]:
+    """
+    JSON-ready form of a reading.
+    """
+    return {"timestamp": str(reading.get_timestamp()),
+            "temperature": reading.get_temperature(),
+            "humidity": reading.get_humidity(),
+            "pressure": reading.get_pressure(),
+            "dewpoint": reading.get_dewpoint(),
+            "filepath": reading.get_image_path(),
+            "lcl_m": reading.get_lcl()}
 
-    return False
+def rollup_to_dict(rollup:RollupEntity) -> Dict[str, Any]:
+    """
+    JSON-ready form of a rollup bucket.
+    """
+    measurements = {"temperature": rollup.get_temperature(),
+                    "humidity": rollup.get_humidity(),
+                    "pressure": rollup.get_pressure(),
+                    "dewpoint": rollup.get_dewpoint()}
+    out = {"bucket": str(rollup.get_timestamp()), "samples": rollup.get_samples()}
+    for name, aggregate in measurements.items():
+        out[name] = aggregate._asdict()
+    return out
 
 def timestamp_to_path(timestamp:str) -> str:
     """
@@ -75,7 +112,7 @@ def timestamp_to_path(timestamp:str) -> str:
 
 def header_check(req_headers: Headers, headers: Tuple[str]) -> Request | None:
     """
-    Check for header existence and apply MAC filter.
+    Check for header existence, apply the per-device rate limit and then the MAC filter.
     """
     missing_headers = [header for header in headers if req_headers.get(header) is None]
     if missing_headers:
@@ -87,6 +124,11 @@ def header_check(req_headers: Headers, headers: Tuple[str]) -> Request | None:
         return jsonify({"error": f"Incorrect header fields: {', '.join(missing_headers)}"}), 400
     
     if len(mac_header) == 1:
+        # Rate limit before anything touches the database.
+        retry_after = RateLimiter.acquire(request.endpoint, req_headers.get(mac_header[0]))
+        if retry_after > 0:
+            return jsonify({"error": "Too many requests"}), 429, {"Retry-After": str(ceil(retry_after))}
+
         # print(f"Is the mac {req_headers.get(mac_header[0])} in the thing? - {not mac_filter(req_headers.get(mac_header[0]))}")
         if mac_filter(req_headers.get(mac_header[0])):
             return jsonify({"error": "Unauthorized"}), 401
@@ -0,0 +1,51 @@
+from src.config import *
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+class RateLimiter:
+    """
+    Static per-device token-bucket rate limiter.
+    Each (route, MAC) pair gets a bucket refilled at the route's rate up to its burst size.
+    Buckets are kept in LRU order and the least recently seen are evicted past
+    RATE_LIMIT_MAX_KEYS, so memory stays bounded however large the fleet grows.
+    """
+    __buckets:OrderedDict[Tuple[str, str], List[float]] = OrderedDict()
+    __lock:Lock = Lock()
+    __max_keys:int = RATE_LIMIT_MAX_KEYS
+
+    @staticmethod
+    def acquire(route:str, MAC:str) -> float:
+        """
+        Take a token for a device on a route.
+        Return 0 if allowed, otherwise the number of seconds until a token is available.
+        """
+        limit = RATE_LIMITS.get(route)
+        if limit is None: return 0.0
+        rate, burst = limit
+
+        key = (route, MAC)
+        now = monotonic()
+        buckets = RateLimiter.__buckets
+        with RateLimiter.__lock:
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = [float(burst), now]
+                buckets[key] = bucket
+                if len(buckets) > RateLimiter.__max_keys: buckets.popitem(last = False)
+            else:
+                buckets.move_to_end(key)
+
+            tokens, last = bucket
+            tokens = min(float(burst), tokens + (now - last) * rate)
+            bucket[1] = now
+            if tokens >= 1.0:
+                bucket[0] = tokens - 1.0
+                return 0.0
+
+            bucket[0] = tokens
+            return (1.0 - tokens) / rate
+
+    @staticmethod
+    def size() -> int:
+        return len(RateLimiter.__buckets)
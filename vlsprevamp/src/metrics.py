@@ -0,0 +1,168 @@
+from src.config import *
+from src.db.Timing import QueryStats
+from flask import g, request, Response
+from threading import Lock, local, current_thread, Thread
+from bisect import bisect_left
+from time import perf_counter
+
+# Upper bounds in seconds of the request latency histogram buckets.
+LATENCY_BUCKETS:Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RouteStats:
+    """
+    Request counters and latency histogram of one route, as seen by one thread.
+    """
+    __slots__ = ("codes", "errors", "total", "buckets", "queries", "query_seconds")
+
+    def __init__(self):
+        self.codes:Dict[str, int] = {}
+        self.errors:int = 0
+        self.total:float = 0.0
+        self.buckets:List[int] = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.queries:int = 0
+        self.query_seconds:float = 0.0
+
+    def merge(self, other:"RouteStats") -> None:
+        for code, count in list(other.codes.items()):
+            self.codes[code] = self.codes.get(code, 0) + count
+        self.errors += other.errors
+        self.total += other.total
+        for i, count in enumerate(other.buckets):
+            self.buckets[i] += count
+        self.queries += other.queries
+        self.query_seconds += other.query_seconds
+
+
+class Metrics:
+    """
+    Static request metrics registry.
+    Every thread records into its own shard without locking. Shards are only summed when
+    /metrics is scraped, and shards of finished threads are folded into a retired total
+    so memory stays bounded under thread-per-request servers.
+    """
+    __local:local = local()
+    __shards:List[Tuple[Thread, Dict[str, RouteStats]]] = []
+    __retired:Dict[str, RouteStats] = {}
+    __lock:Lock = Lock()
+
+    @staticmethod
+    def observe(route:str, status:int, seconds:float, queries:int = 0, query_seconds:float = 0.0) -> None:
+        """
+        Record one finished request and the database statements it ran.
+        """
+        shard = getattr(Metrics.__local, "shard", None)
+        if shard is None: shard = Metrics.__register()
+
+        stats = shard.get(route)
+        if stats is None:
+            stats = RouteStats()
+            shard[route] = stats
+
+        code = f"{status // 100}xx"
+        stats.codes[code] = stats.codes.get(code, 0) + 1
+        if status >= 500: stats.errors += 1
+        stats.total += seconds
+        stats.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        stats.queries += queries
+        stats.query_seconds += query_seconds
+
+    @staticmethod
+    def snapshot() -> Dict[str, RouteStats]:
+        """
+        Sum the shards of every thread into one set of route stats.
+        """
+        with Metrics.__lock:
+            Metrics.__compact()
+            merged:Dict[str, RouteStats] = {}
+            for shard in [Metrics.__retired] + [shard for _, shard in Metrics.__shards]:
+                for route, stats in list(shard.items()):
+                    merged.setdefault(route, RouteStats()).merge(stats)
+        return merged
+
+    @staticmethod
+    def __register() -> Dict[str, RouteStats]:
+        """
+        Create the shard of the current thread.
+        """
+        shard:Dict[str, RouteStats] = {}
+        Metrics.__local.shard = shard
+        with Metrics.__lock:
+            Metrics.__shards.append((current_thread(), shard))
+            if len(Metrics.__shards) > 64: Metrics.__compact()
+        return shard
+
+    @staticmethod
+    def __compact() -> None:
+        """
+        Fold the shards of finished threads into the retired total. Must hold the lock.
+        """
+        alive = []
+        for thread, shard in Metrics.__shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+                continue
+            for route, stats in shard.items():
+                Metrics.__retired.setdefault(route, RouteStats()).merge(stats)
+        Metrics.__shards = alive
+
+
+def before_request() -> None:
+    QueryStats.take()
+    g._metrics_start = perf_counter()
+
+
+def after_request(response:Response) -> Response:
+    start = g.pop("_metrics_start", None)
+    if start is not None:
+        queries, seconds = QueryStats.take()
+        Metrics.observe(request.endpoint or "unmatched", response.status_code, perf_counter() - start,
+                        queries, seconds)
+    return response
+
+
+def render(gauges:Dict[str, Tuple[str, float]], counters:Dict[str, Tuple[str, float]] | None = None) -> str:
+    """
+    Render the request metrics and the given process gauges and counters in the Prometheus text format.
+    gauges and counters map a metric name to its help text and value.
+    """
+    snapshot = Metrics.snapshot()
+    lines = ["# HELP http_requests_total Requests handled, by route and status class.",
+             "# TYPE http_requests_total counter"]
+    for route, stats in sorted(snapshot.items()):
+        for code, count in sorted(stats.codes.items()):
+            lines.append(f'http_requests_total{{route="{route}",code="{code}"}} {count}')
+
+    lines += ["# HELP http_request_errors_total Requests that ended in a server error, by route.",
+              "# TYPE http_request_errors_total counter"]
+    for route, stats in sorted(snapshot.items()):
+        lines.append(f'http_request_errors_total{{route="{route}"}} {stats.errors}')
+
+    lines += ["# HELP http_request_duration_seconds Request latency, by route.",
+              "# TYPE http_request_duration_seconds histogram"]
+    for route, stats in sorted(snapshot.items()):
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), stats.buckets):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else f"{bound}"
+            lines.append(f'http_request_duration_seconds_bucket{{route="{route}",le="{le}"}} {cumulative}')
+        lines.append(f'http_request_duration_seconds_sum{{route="{route}"}} {stats.total}')
+        lines.append(f'http_request_duration_seconds_count{{route="{route}"}} {cumulative}')
+
+    lines += ["# HELP http_request_db_queries_total Database statements run while handling requests, by route.",
+              "# TYPE http_request_db_queries_total counter"]
+    for route, stats in sorted(snapshot.items()):
+        lines.append(f'http_request_db_queries_total{{route="{route}"}} {stats.queries}')
+
+    lines += ["# HELP http_request_db_seconds_total Time spent in database statements while handling requests, by route.",
+              "# TYPE http_request_db_seconds_total counter"]
+    for route, stats in sorted(snapshot.items()):
+        lines.append(f'http_request_db_seconds_total{{route="{route}"}} {stats.query_seconds}')
+
+    for name, (help_text, value) in (counters or {}).items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter", f"{name} {value}"]
+
+    for name, (help_text, value) in gauges.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+
+    return "\n".join(lines) + "\n"
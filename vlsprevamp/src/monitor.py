@@ -0,0 +1,98 @@
+from src.config import *
+from src.db.Management import Manager
+from psutil import Process
+from collections import deque
+from threading import Thread, Event, Lock
+from os import getpid
+
+# Fields of a sample that are summarised with min/max/avg.
+SAMPLE_FIELDS:Tuple[str, ...] = ("rss_mb", "cpu_percent", "threads", "open_fds", "db_in_use")
+
+
+class ResourceSampler:
+    """
+    Static background sampler of process resource usage.
+    Every SAMPLE_INTERVAL seconds it records RSS, CPU, thread count, open file descriptors and
+    database pool usage into a ring buffer of SAMPLE_HISTORY entries, so reading the history
+    costs nothing and slow memory creep stays visible.
+    """
+    __history:deque = deque(maxlen = SAMPLE_HISTORY)
+    __process:Process = Process(getpid())
+    __stop:Event = Event()
+    __thread:Thread | None = None
+    __lock:Lock = Lock()
+
+    @staticmethod
+    def start() -> None:
+        """
+        Start the sampler thread if it is not already running.
+        """
+        with ResourceSampler.__lock:
+            if ResourceSampler.running(): return
+            ResourceSampler.__stop.clear()
+            ResourceSampler.__thread = Thread(target = ResourceSampler.__run, name = "resource-sampler", daemon = True)
+            ResourceSampler.__thread.start()
+
+    @staticmethod
+    def stop() -> None:
+        with ResourceSampler.__lock:
+            thread = ResourceSampler.__thread
+            if thread is None: return
+            ResourceSampler.__stop.set()
+            thread.join()
+            ResourceSampler.__thread = None
+
+    @staticmethod
+    def running() -> bool:
+        thread = ResourceSampler.__thread
+        return thread is not None and thread.is_alive()
+
+    @staticmethod
+    def sample(process:Process | None = None) -> Dict[str, float | int | str]:
+        """
+        Take one sample of the current resource usage.
+        cpu_percent is measured since the previous call on the same Process, so callers outside
+        the sampler thread pass their own rather than shortening the sampler's interval.
+        """
+        process = ResourceSampler.__process if process is None else process
+        with process.oneshot():
+            rss = process.memory_info().rss
+            cpu = process.cpu_percent()
+            threads = process.num_threads()
+            fds = process.num_fds() if hasattr(process, "num_fds") else process.num_handles()
+
+        return {"time": datetime.now().isoformat(timespec = "seconds"),
+                "rss_mb": round(rss / (1024 ** 2), 2),
+                "cpu_percent": cpu,
+                "threads": threads,
+                "open_fds": fds,
+                "db_in_use": Manager.stats()["in_use"]}
+
+    @staticmethod
+    def history() -> List[Dict[str, float | int | str]]:
+        return list(ResourceSampler.__history)
+
+    @staticmethod
+    def summary(history:List[Dict[str, float | int | str]] = None) -> Dict[str, Dict[str, float]]:
+        """
+        Min, max and average of each sampled field over the history.
+        """
+        history = ResourceSampler.history() if history is None else history
+        summary = {}
+        for field in SAMPLE_FIELDS:
+            values = [sample[field] for sample in history]
+            if not values: continue
+            summary[field] = {"min": min(values),
+                              "max": max(values),
+                              "avg": round(sum(values) / len(values), 2)}
+        return summary
+
+    @staticmethod
+    def __run() -> None:
+        # The first cpu_percent() call only primes the counter.
+        ResourceSampler.__process.cpu_percent()
+        while not ResourceSampler.__stop.wait(SAMPLE_INTERVAL):
+            try:
+                ResourceSampler.__history.append(ResourceSampler.sample())
+            except Exception as e:
+                debug(f"Couldn't sample resource usage -> {e}")
@@ -0,0 +1,113 @@
+from src.config import *
+from threading import Lock
+from typing import IO
+import hashlib
+import tempfile
+
+class ImageStore:
+    """
+    Static content-addressed store for uploaded images.
+
+    Images are sharded by device and date and named by the SHA-256 of their content:
+        IMAGE_UPLOADS/<MAC>/<YYYY-MM-DD>/<sha256>.jpg
+    Identical uploads within a shard share one blob. Each shard keeps an append-only index,
+    one tab-separated "<timestamp> <blob name>" line per upload, the last line for a timestamp winning.
+    Appending keeps a put constant-time, and a line torn by a crash is ignored by lookups
+    and closed off by the next append.
+    Shards indexed by earlier versions keep their index.toml, which is still read.
+    """
+    __root:str = IMAGE_UPLOADS
+    __index_name:str = "index.tsv"
+    __legacy_index_name:str = "index.toml"
+    __lock:Lock = Lock()
+
+    @staticmethod
+    def shard(MAC:str, timestamp:str) -> str:
+        """
+        Folder holding the images of a device for the day of the timestamp.
+        """
+        try:
+            day = datetime.fromisoformat(timestamp).strftime("%Y-%m-%d")
+        except ValueError:
+            day = "undated"
+        return os.path.join(ImageStore.__root, MAC.replace(":", "-"), day)
+
+    @staticmethod
+    def put(stream:IO[bytes], MAC:str, timestamp:str, limit:int = MAX_IMAGE_BYTES,
+            chunk_size:int = UPLOAD_CHUNK_BYTES) -> Tuple[str | None, int]:
+        """
+        Stream an image into the store in fixed-size chunks, hashing as it is written.
+        Return the blob path and the number of bytes read. The path is None if the image was
+        empty or larger than limit, in which case nothing is kept.
+        """
+        folder = mkdir(ImageStore.shard(MAC, timestamp))
+        fd, tmp_path = tempfile.mkstemp(dir = folder, suffix = ".part")
+        digest = hashlib.sha256()
+        written = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while True:
+                    chunk = stream.read(chunk_size)
+                    if not chunk: break
+                    written += len(chunk)
+                    if written > limit: break
+                    digest.update(chunk)
+                    f.write(chunk)
+
+            if written == 0 or written > limit:
+                os.remove(tmp_path)
+                return None, written
+
+            path = os.path.join(folder, f"{digest.hexdigest()}.jpg")
+            with ImageStore.__lock:
+                # Identical content already stored, drop the duplicate.
+                if os.path.exists(path): os.remove(tmp_path)
+                else: os.replace(tmp_path, path)
+                ImageStore.__index(folder, timestamp, os.path.basename(path))
+            return path, written
+
+        except Exception:
+            if os.path.exists(tmp_path): os.remove(tmp_path)
+            raise
+
+    @staticmethod
+    def lookup(MAC:str, timestamp:str) -> str | None:
+        """
+        Path of the image stored for a reading, if any.
+        """
+        folder = ImageStore.shard(MAC, timestamp)
+        if not os.path.exists(folder): return None
+
+        legacy_path = os.path.join(folder, ImageStore.__legacy_index_name)
+        legacy = (load_toml(legacy_path) if os.path.exists(legacy_path) else None) or {}
+        name = legacy.get(str(timestamp))
+
+        index_path = os.path.join(folder, ImageStore.__index_name)
+        if os.path.exists(index_path):
+            with open(index_path, "r", encoding = "utf-8") as f:
+                for line in f:
+                    if not line.endswith("\n"): break
+                    key, _, value = line.rstrip("\n").partition("\t")
+                    if key == str(timestamp) and ImageStore.__blob_name(value): name = value
+
+        return os.path.join(folder, name) if name else None
+
+    @staticmethod
+    def __blob_name(name:str) -> bool:
+        """
+        Check an index entry names a whole blob, "<sha256>.jpg", and not what a torn append left.
+        """
+        stem, extension = os.path.splitext(name)
+        return extension == ".jpg" and len(stem) == 64 and all(c in "0123456789abcdef" for c in stem)
+
+    @staticmethod
+    def __index(folder:str, timestamp:str, name:str) -> None:
+        """
+        Point a timestamp at a blob by appending a line to the shard index. Must hold the store lock.
+        """
+        index_path = os.path.join(folder, ImageStore.__index_name)
+        key = str(timestamp).replace("\t", " ").replace("\n", " ")
+        with open(index_path, "a+b") as f:
+            # Start a fresh line if the last append was torn by a crash.
+            torn = f.tell() > 0 and f.seek(-1, os.SEEK_END) is not None and f.read(1) != b"\n"
+            f.write(f"{chr(10) if torn else ''}{key}\t{name}\n".encode("utf-8"))
@@ -1,10 +1,23 @@
 from src.handlers import *
+from src.metrics import render
+from src.limits import RateLimiter
+from src.db.Registry import DeviceRegistry
+from src.db.Timing import QueryStats
+from src.monitor import ResourceSampler
 from psutil import Process, cpu_percent
 from os import getpid
 from flask_login import login_required, current_user
 
 views = Blueprint("views", __name__)
 
+# Kept across calls so cpu_percent() measures usage since the previous scrape.
+PROCESS = Process(getpid())
+
+# /system-info samples through its own Process when the sampler has no history yet, primed here
+# so its first cpu_percent() is the usage since startup rather than 0.0.
+SYSTEM_INFO_PROCESS = Process(getpid())
+SYSTEM_INFO_PROCESS.cpu_percent()
+
 @views.route("/")
 @login_required
 def index() -> Response:
@@ -17,9 +30,41 @@ def about() -> Response:
 @views.route('/system-info')
 def system_info() -> Response:
     """
-    Memory info and cpu usage in json return.
+    Memory info, cpu usage, write-behind queue and image pipeline counters in json return.
+    cpu_usage is system-wide; the samples hold the CPU usage of this process.
+    Also the sampled resource history with its min/max/avg, if the sampler is running.
     """
-    pid = getpid()
-    memory_usage = f"{Process(pid).memory_info().rss / (1024 ** 2):.2f}"  # in MB
+    history = ResourceSampler.history()
+    latest = history[-1] if history else ResourceSampler.sample(SYSTEM_INFO_PROCESS)
+    memory_usage = f"{latest['rss_mb']:.2f}"  # in MB
     cpu_usage = f"{cpu_percent():.2f}"
-    return jsonify(memory_usage=memory_usage, cpu_usage=cpu_usage)
\ No newline at end of file
+    return jsonify(memory_usage=memory_usage, cpu_usage=cpu_usage,
+                   latest=latest, summary=ResourceSampler.summary(history), history=history,
+                   ingest=IngestQueue.stats(), pipeline=ImagePipeline.stats())
+
+@views.route('/metrics')
+def metrics() -> Response:
+    """
+    Request counts, error counts, latency histograms and database statements per route
+    plus process gauges, in the Prometheus text exposition format.
+    """
+    process = PROCESS
+    pool = Manager.stats()
+    ingest = IngestQueue.stats()
+    gauges = {
+        "process_resident_memory_bytes": ("Resident set size in bytes.", process.memory_info().rss),
+        "process_cpu_percent": ("CPU usage of the process in percent.", process.cpu_percent()),
+        "process_threads": ("Number of threads in the process.", process.num_threads()),
+        "db_pool_size": ("Connections in the database pool.", pool["size"]),
+        "db_pool_in_use": ("Database connections checked out.", pool["in_use"]),
+        "ingest_queue_depth": ("Entries waiting in the write-behind queue.", ingest["depth"]),
+        "device_registry_size": ("Devices held in the registry cache.", DeviceRegistry.size()),
+        "rate_limiter_buckets": ("Token buckets held by the rate limiter.", RateLimiter.size())
+    }
+    queries = QueryStats.stats()
+    counters = {
+        "db_queries_total": ("Database statements executed.", queries["queries"]),
+        "db_query_seconds_total": ("Time spent executing database statements.", queries["seconds"]),
+        "db_slow_queries_total": ("Statements slower than the slow-query threshold.", queries["slow"])
+    }
+    return Response(render(gauges, counters), mimetype="text/plain; version=0.0.4")